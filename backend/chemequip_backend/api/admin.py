@@ -2,7 +2,7 @@
 Admin configuration for chemical equipment app
 """
 from django.contrib import admin
-from chemequip_backend.api.models import Dataset, Equipment
+from chemequip_backend.api.models import Dataset, Equipment, Job
 
 
 @admin.register(Dataset)
@@ -10,14 +10,14 @@ class DatasetAdmin(admin.ModelAdmin):
     list_display = ['filename', 'user', 'uploaded_at', 'equipment_count']
     list_filter = ['uploaded_at', 'user']
     search_fields = ['filename', 'user__username']
-    readonly_fields = ['uploaded_at', 'equipment_count', 'summary_stats']
+    readonly_fields = ['uploaded_at', 'equipment_count', 'summary_stats', 'stats_state']
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('user', 'filename', 'file', 'uploaded_at')
         }),
         ('Statistics', {
-            'fields': ('equipment_count', 'summary_stats')
+            'fields': ('equipment_count', 'summary_stats', 'stats_state')
         }),
     )
 
@@ -40,3 +40,11 @@ class EquipmentAdmin(admin.ModelAdmin):
             'fields': ('created_at',)
         }),
     )
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'state', 'filename', 'user', 'rows_processed', 'created_at']
+    list_filter = ['kind', 'state', 'created_at']
+    search_fields = ['filename', 'user__username']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'rows_processed', 'progress', 'error']
@@ -0,0 +1,221 @@
+"""
+Vectorized analytics over a dataset's parameter columns
+
+Columns are read from the memory-mapped columnar sidecar when a dataset
+has one and from the Equipment table otherwise, then reduced with NumPy
+so clients receive a small summary instead of every row.
+"""
+import numpy as np
+from django.conf import settings
+from chemequip_backend.api.columnar import load_dataset_columns
+from chemequip_backend.api.csv_utils import PARAMETERS
+from chemequip_backend.api.models import Equipment
+
+DEFAULT_BINS = 50
+MAX_BINS = 1000
+PERCENTILES = [5, 25, 50, 75, 95]
+
+CHART_MODES = ('sample', 'density')
+DEFAULT_CHART_POINTS = 2000
+MAX_CHART_POINTS = 10000
+DEFAULT_RESOLUTION = 50
+MAX_RESOLUTION = 200
+
+
+def _round(values):
+    # Sidecar columns are float32; 6 significant digits hide the noise
+    return [float(f'{value:.6g}') for value in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def load_parameter_values(dataset, param):
+    """
+    Return the non-missing values of one parameter of a dataset as float64
+    """
+    columns = load_dataset_columns(dataset)
+    if columns is not None:
+        values = np.asarray(columns[param], dtype=np.float64)
+        return values[~np.isnan(values)]
+
+    rows = (
+        Equipment.objects.filter(dataset=dataset, **{f'{param}__isnull': False})
+        .order_by()
+        .values_list(param, flat=True)
+        .iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+    )
+    return np.fromiter(rows, dtype=np.float64)
+
+
+def load_parameter_table(dataset, params):
+    """
+    Return (values, codes, types) for the rows of a dataset
+
+    ``values`` is a float64 (rows x params) array with NaN for missing
+    values, ``codes`` indexes each row's equipment type in ``types``.
+    """
+    columns = load_dataset_columns(dataset)
+    if columns is not None:
+        values = np.column_stack([np.asarray(columns[param], dtype=np.float64) for param in params])
+        return values, np.asarray(columns['equipment_type'], dtype=np.intp), list(columns['types'])
+
+    rows = list(Equipment.objects.filter(dataset=dataset).order_by('id').values_list('equipment_type', *params))
+    names = np.array([row[0] for row in rows], dtype=object)
+    types, codes = np.unique(names, return_inverse=True) if rows else ([], np.empty(0, dtype=np.intp))
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(params))
+    return values, codes, list(types)
+
+
+def histogram(values, param, bins=DEFAULT_BINS):
+    """
+    Summarize values as histogram bins and percentiles
+
+    Returns ``bins`` equal-width bins between the minimum and maximum
+    (``bin_edges`` has one more entry than ``counts``) and the p5, p25,
+    p50, p75 and p95 percentiles, interpolated linearly.
+    """
+    if not len(values):
+        return {
+            'param': param,
+            'count': 0,
+            'min': None,
+            'max': None,
+            'bin_edges': [],
+            'counts': [],
+            'percentiles': {f'p{p}': None for p in PERCENTILES},
+        }
+
+    low, high = float(values.min()), float(values.max())
+    counts, edges = np.histogram(values, bins=bins, range=(low, high))
+    percentiles = np.percentile(values, PERCENTILES)
+
+    return {
+        'param': param,
+        'count': int(len(values)),
+        'min': _round([low])[0],
+        'max': _round([high])[0],
+        'bin_edges': _round(edges),
+        'counts': counts.tolist(),
+        'percentiles': dict(zip((f'p{p}' for p in PERCENTILES), _round(percentiles))),
+    }
+
+
+def dataset_histogram(datasets, param, bins=DEFAULT_BINS):
+    """
+    Histogram and percentiles of a parameter over one or more datasets
+    """
+    values = [load_parameter_values(dataset, param) for dataset in datasets]
+    return histogram(np.concatenate(values) if values else np.empty(0), param, bins)
+
+
+def parse_histogram_params(query_params):
+    """
+    Validate ``param`` and ``bins`` query parameters
+
+    Returns (param, bins, error); error is a message when they are invalid.
+    """
+    param = query_params.get('param', '')
+    if param not in PARAMETERS:
+        return None, None, f"'param' must be one of: {', '.join(PARAMETERS)}"
+
+    try:
+        bins = int(query_params.get('bins', DEFAULT_BINS))
+    except ValueError:
+        bins = 0
+    if not 1 <= bins <= MAX_BINS:
+        return None, None, f"'bins' must be an integer between 1 and {MAX_BINS}"
+
+    return param, bins, None
+
+
+def stratified_sample(codes, points, seed):
+    """
+    Pick up to ``points`` row indices, stratified by equipment type
+
+    Each type gets a share proportional to its size, and at least one row,
+    so rare types stay visible. Sampling is seeded, so the same dataset
+    always yields the same picture. Indices are returned sorted.
+    """
+    if len(codes) <= points:
+        return np.arange(len(codes))
+
+    rng = np.random.default_rng(seed)
+    sizes = np.bincount(codes)
+    quotas = np.minimum(np.maximum(sizes * points // len(codes), sizes > 0), sizes)
+    # The one-row minimum can overshoot a tiny budget; trim the largest shares
+    for code in np.argsort(-quotas, kind='stable')[:max(quotas.sum() - points, 0)]:
+        quotas[code] -= 1
+    picked = [
+        rng.choice(np.flatnonzero(codes == code), size=quota, replace=False)
+        for code, quota in enumerate(quotas) if quota
+    ]
+    return np.sort(np.concatenate(picked))
+
+
+def chart_data(dataset, params, mode='sample', points=DEFAULT_CHART_POINTS, resolution=DEFAULT_RESOLUTION):
+    """
+    Bounded-size data for plotting parameters of a dataset against each other
+
+    ``sample`` mode returns at most ``points`` rows, stratified by type,
+    as one column list per parameter under each type. ``density`` mode
+    bins the first two parameters into a ``resolution`` x ``resolution``
+    grid; ``counts[i][j]`` is the number of rows in x bin i and y bin j.
+    Rows missing any of the parameters are left out either way.
+    """
+    values, codes, types = load_parameter_table(dataset, params)
+    complete = ~np.isnan(values).any(axis=1)
+    values, codes = values[complete], codes[complete]
+    result = {'mode': mode, 'params': list(params), 'total': int(len(values))}
+
+    if mode == 'density':
+        x, y = values[:, 0], values[:, 1]
+        ranges = [(x.min(), x.max()), (y.min(), y.max())] if len(values) else None
+        counts, x_edges, y_edges = np.histogram2d(x, y, bins=resolution, range=ranges)
+        result.update({
+            'resolution': resolution,
+            'x_edges': _round(x_edges),
+            'y_edges': _round(y_edges),
+            'counts': counts.astype(np.int64).tolist(),
+        })
+        return result
+
+    selected = stratified_sample(codes, points, seed=dataset.pk)
+    values, codes = values[selected], codes[selected]
+    series = {}
+    for code in np.unique(codes):
+        rows = values[codes == code]
+        series[types[code]] = {param: _round(rows[:, i]) for i, param in enumerate(params)}
+    result.update({'returned': int(len(selected)), 'series': series})
+    return result
+
+
+def parse_chart_params(query_params):
+    """
+    Validate ``params``, ``mode``, ``points`` and ``resolution`` query parameters
+
+    Returns (options, error); options are chart_data() keyword arguments
+    and error is a message when the parameters are invalid.
+    """
+    params = [name.strip() for name in query_params.get('params', 'flowrate,pressure').split(',') if name.strip()]
+    if len(set(params)) != len(params) or not 2 <= len(params) <= len(PARAMETERS) \
+            or any(param not in PARAMETERS for param in params):
+        return None, f"'params' must list 2 or 3 distinct parameters of: {', '.join(PARAMETERS)}"
+
+    mode = query_params.get('mode', 'sample')
+    if mode not in CHART_MODES:
+        return None, f"'mode' must be one of: {', '.join(CHART_MODES)}"
+
+    options = {'params': params, 'mode': mode}
+    if mode == 'density':
+        if len(params) != 2:
+            return None, "'density' mode takes exactly 2 params"
+        name, default, limit = 'resolution', DEFAULT_RESOLUTION, MAX_RESOLUTION
+    else:
+        name, default, limit = 'points', DEFAULT_CHART_POINTS, MAX_CHART_POINTS
+
+    try:
+        options[name] = int(query_params.get(name, default))
+    except ValueError:
+        options[name] = 0
+    if not 1 <= options[name] <= limit:
+        return None, f"'{name}' must be an integer between 1 and {limit}"
+
+    return options, None
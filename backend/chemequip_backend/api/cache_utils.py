@@ -0,0 +1,95 @@
+"""
+Versioned response cache for per-user analytics endpoints
+
+Every user has a data version, stored in the database (DataVersion), that
+is replaced in the same transaction whenever one of their datasets is
+created, deleted or recomputed. Cached payloads are stored with the
+version they were built from and are only served while it is still
+current, so a change made by any process (a web worker, process_jobs or
+a management command) invalidates all of the user's entries at once,
+whichever cache backend holds them.
+"""
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+from chemequip_backend.api.models import DataVersion
+
+
+def _entry_key(user_id, name):
+    return f'response:{user_id}:{name}'
+
+
+def _new_version():
+    # Random rather than a counter, so a recreated database never matches
+    # entries left in a shared cache
+    return uuid.uuid4().hex
+
+
+def bump_data_version(user_id):
+    """
+    Invalidate every cached payload of a user
+
+    Call it inside the transaction that changes the data: the new version
+    becomes visible together with the change, so a payload rebuilt from
+    the old data in the meantime is never served afterwards.
+    """
+    # A single upsert, so a bump costs one query even for a new user
+    DataVersion.objects.bulk_create(
+        [DataVersion(user_id=user_id, version=_new_version())],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['version']
+    )
+
+
+def current_data_version(user_id):
+    """
+    Return a user's data version ('' before their data first changes)
+    """
+    version = DataVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+    return version or ''
+
+
+def cached_response(request, name, build):
+    """
+    Return a cached, ETag-validated Response for a per-user payload
+
+    ``name`` identifies the payload within the user's data (e.g.
+    ``dataset-summary:12``) and ``build()`` computes it, or returns None
+    when the resource does not exist, in which case None is returned and
+    nothing is cached. Repeat requests cost one query for the data
+    version and one cache round trip; requests whose If-None-Match
+    matches get a 304.
+    """
+    user_id = request.user.pk
+    entry_key = _entry_key(user_id, name)
+    version = current_data_version(user_id)
+
+    # The representation depends on the data version and the renderer
+    renderer = getattr(request, 'accepted_renderer', None)
+    etag = '"%s"' % hashlib.md5(
+        f'{entry_key}:{version}:{getattr(renderer, "format", "")}'.encode()
+    ).hexdigest()
+
+    conditional = get_conditional_response(request, etag=etag)
+    if conditional is not None:
+        conditional['ETag'] = etag
+        return conditional
+
+    entry = cache.get(entry_key)
+    if entry is not None and entry[0] == version:
+        payload = entry[1]
+    else:
+        payload = build()
+        if payload is None:
+            return None
+        timeout = getattr(settings, 'SUMMARY_CACHE_TIMEOUT', 3600)
+        cache.set(entry_key, (version, payload), timeout)
+
+    response = Response(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,169 @@
+"""
+Columnar sidecar storage for dataset parameters
+
+Next to each stored CSV file (``<file>.columns/``) ingest writes one raw
+little-endian file per column plus a ``meta.json`` describing them:
+
+- flowrate, pressure, temperature: float32, NaN for missing values
+- equipment_type: uint16 codes into the ``types`` list in meta.json
+
+The loader memory-maps those files into NumPy arrays, so analytics can
+read whole columns without building Equipment model instances. The
+Equipment rows remain the system of record; a missing or unreadable
+sidecar just means callers fall back to the database.
+"""
+import json
+import os
+import shutil
+import numpy as np
+from chemequip_backend.api.csv_utils import PARAMETERS, array_stats_state
+
+SIDECAR_SUFFIX = '.columns'
+FORMAT_VERSION = 1
+
+VALUE_DTYPE = np.dtype('<f4')
+CODE_DTYPE = np.dtype('<u2')
+
+
+def sidecar_path(dataset):
+    """
+    Return the sidecar directory of a dataset, or None if it cannot have one
+
+    Only datasets whose file lives on the local filesystem get a sidecar,
+    since the columns are memory-mapped.
+    """
+    if not dataset.file:
+        return None
+    try:
+        return dataset.file.path + SIDECAR_SUFFIX
+    except NotImplementedError:
+        return None
+
+
+class ColumnarWriter:
+    """
+    Append converted frames to a dataset's column files
+
+    Columns are written into a temporary directory that replaces the
+    sidecar only on close(), so readers never see a half-written one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp-{os.getpid()}-{id(self)}"
+        os.makedirs(self.tmp_path)
+
+        self.rows = 0
+        self.types = {}
+        self.files = {
+            field: open(os.path.join(self.tmp_path, field), 'wb')
+            for field in PARAMETERS + ['equipment_type']
+        }
+
+    def append(self, frame):
+        """
+        Write the rows of a converted frame (see csv_utils.convert_frame)
+        """
+        for field in PARAMETERS:
+            frame[field].to_numpy(dtype=VALUE_DTYPE).tofile(self.files[field])
+
+        # Dictionary-encode the types, extending the dictionary as new ones appear
+        codes, uniques = frame['equipment_type'].factorize()
+        mapping = np.array([self.types.setdefault(name, len(self.types)) for name in uniques], dtype=CODE_DTYPE)
+        mapping[codes].tofile(self.files['equipment_type'])
+
+        self.rows += len(frame)
+
+    def close(self):
+        """
+        Finish the column files and move them into place
+        """
+        for f in self.files.values():
+            f.close()
+
+        meta = {
+            'version': FORMAT_VERSION,
+            'rows': self.rows,
+            'columns': {field: VALUE_DTYPE.str for field in PARAMETERS},
+            'codes': CODE_DTYPE.str,
+            'types': list(self.types),
+        }
+        with open(os.path.join(self.tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """
+        Discard everything written so far
+        """
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+def open_columnar_writer(dataset):
+    """
+    Return a ColumnarWriter for a dataset, or None if it cannot have a sidecar
+    """
+    path = sidecar_path(dataset)
+    if path is None:
+        return None
+    try:
+        return ColumnarWriter(path)
+    except OSError:
+        return None
+
+
+def load_dataset_columns(dataset):
+    """
+    Memory-map a dataset's sidecar columns
+
+    Returns a dict with one read-only array per parameter, the
+    ``equipment_type`` codes, the ``types`` dictionary and the ``rows``
+    count; or None when the dataset has no usable sidecar.
+    """
+    path = sidecar_path(dataset)
+    if path is None:
+        return None
+
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            return None
+
+        rows = meta['rows']
+        dtypes = {field: np.dtype(meta['columns'][field]) for field in PARAMETERS}
+        dtypes['equipment_type'] = np.dtype(meta['codes'])
+
+        columns = {'rows': rows, 'types': meta['types']}
+        for field, dtype in dtypes.items():
+            if rows:
+                columns[field] = np.memmap(os.path.join(path, field), dtype=dtype, mode='r', shape=(rows,))
+            else:
+                columns[field] = np.empty(0, dtype=dtype)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return columns
+
+
+def columns_stats_state(columns):
+    """
+    Compute the statistics accumulator of loaded sidecar columns
+    """
+    values = np.column_stack([columns[field] for field in PARAMETERS])
+    counts = np.bincount(columns['equipment_type'], minlength=len(columns['types']))
+    type_counts = {name: int(n) for name, n in zip(columns['types'], counts) if n}
+    return array_stats_state(values, type_counts)
+
+
+def delete_dataset_columns(dataset):
+    """
+    Remove a dataset's sidecar, if any
+    """
+    path = sidecar_path(dataset)
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,188 @@
+"""
+Dataset-to-dataset comparison
+
+Both datasets' equipment is loaded into DataFrames and joined on the
+normalized equipment name with a pandas hash join, so the cost is linear
+in the number of rows.
+"""
+import pandas as pd
+from django.db import connection
+from chemequip_backend.api.csv_utils import PARAMETERS
+from chemequip_backend.api.filters import MAX_ID
+from chemequip_backend.api.models import Equipment
+from chemequip_backend.api.utils import calculate_summary_stats
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# summary_stats keys compared between the datasets, per parameter
+DRIFT_STATS = ['avg', 'min', 'max', 'std', 'median', 'p95']
+COLUMNS = ['name', 'equipment_type'] + PARAMETERS
+
+
+def normalize_names(names):
+    """
+    Normalize a Series of equipment names for matching
+
+    Names are trimmed, case-folded and have inner whitespace collapsed to
+    single spaces.
+    """
+    return names.str.casefold().str.split().str.join(' ')
+
+
+def match_keys(names):
+    """
+    Return the join key of each name in a Series
+
+    Repeats of a normalized name get their occurrence number appended, so
+    the n-th duplicate in one dataset is matched with the n-th in the other.
+    """
+    keys = normalize_names(names)
+    if keys.duplicated().any():
+        occurrence = keys.groupby(keys, sort=False).cumcount()
+        repeat = occurrence.to_numpy() > 0
+        # Normalized names never contain a tab, so suffixed keys stay unique
+        keys[repeat] = keys[repeat] + '\t' + occurrence[repeat].astype(str)
+    return keys
+
+
+def load_equipment_frame(dataset):
+    """
+    Load a dataset's equipment, in id order, as a DataFrame keyed for the join
+
+    The columns are fetched with one raw cursor query, skipping the ORM's
+    per-row work.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Equipment._meta.get_field(name).column) for name in COLUMNS)
+    dataset_column = quote(Equipment._meta.get_field('dataset').column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {columns} FROM {quote(Equipment._meta.db_table)} WHERE {dataset_column} = %s ORDER BY {quote('id')}",
+            [dataset.id]
+        )
+        frame = pd.DataFrame(cursor.fetchall(), columns=COLUMNS)
+    frame[PARAMETERS] = frame[PARAMETERS].astype('float64')
+    frame['key'] = match_keys(frame['name'])
+    return frame
+
+
+def _delta(base, target):
+    if base is None or target is None:
+        return None
+    return round(target - base, 6)
+
+
+def _records(frame, columns):
+    """
+    Turn frame rows into dicts with None for missing values
+    """
+    frame = frame[columns].astype(object)
+    return frame.where(frame.notna(), None).to_dict('records')
+
+
+def _stats_drift(base_stats, target_stats):
+    drift = {}
+    keys = ['total_equipment'] + [f'{stat}_{field}' for field in PARAMETERS for stat in DRIFT_STATS]
+    for key in keys:
+        base, target = base_stats.get(key), target_stats.get(key)
+        drift[key] = {'base': base, 'target': target, 'delta': _delta(base, target)}
+
+    base_types = base_stats.get('equipment_type_distribution', {})
+    target_types = target_stats.get('equipment_type_distribution', {})
+    drift['equipment_type_distribution'] = {
+        name: {
+            'base': base_types.get(name, 0),
+            'target': target_types.get(name, 0),
+            'delta': target_types.get(name, 0) - base_types.get(name, 0),
+        }
+        for name in sorted(set(base_types) | set(target_types))
+    }
+    return drift
+
+
+def compare_datasets(base, target, limit=DEFAULT_LIMIT):
+    """
+    Compare the equipment of two datasets
+
+    Equipment only in ``target`` is added, only in ``base`` removed, and
+    in both but with a different type or parameter value changed (two
+    missing values count as equal). Each list holds at most ``limit``
+    entries, in target (or base) row order; ``counts`` has the full
+    numbers. Changed entries give base, target and delta per parameter.
+    ``drift`` compares the summary statistics of the two datasets.
+    """
+    merged = load_equipment_frame(base).merge(
+        load_equipment_frame(target),
+        on='key',
+        how='outer',
+        sort=False,
+        suffixes=('_base', '_target'),
+        indicator=True,
+    )
+
+    removed = merged[merged['_merge'] == 'left_only']
+    added = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+
+    differs = both['equipment_type_base'] != both['equipment_type_target']
+    for field in PARAMETERS:
+        values, other = both[f'{field}_base'], both[f'{field}_target']
+        differs |= ~((values == other) | (values.isna() & other.isna()))
+    changed = both[differs.to_numpy()]
+
+    fields = ['equipment_type'] + PARAMETERS
+    changes = []
+    for row in _records(changed[:limit], ['name_target'] + [f'{f}_{side}' for f in fields for side in ('base', 'target')]):
+        change = {'name': row['name_target']}
+        for field in fields:
+            entry = {'base': row[f'{field}_base'], 'target': row[f'{field}_target']}
+            if field in PARAMETERS:
+                entry['delta'] = _delta(entry['base'], entry['target'])
+            change[field] = entry
+        changes.append(change)
+
+    def side(frame, suffix):
+        renamed = frame.rename(columns={f'{column}{suffix}': column for column in COLUMNS})
+        return _records(renamed[:limit], COLUMNS)
+
+    return {
+        'base': {'id': base.id, 'filename': base.filename},
+        'target': {'id': target.id, 'filename': target.filename},
+        'counts': {
+            'added': int(len(added)),
+            'removed': int(len(removed)),
+            'changed': int(len(changed)),
+            'unchanged': int(len(both) - len(changed)),
+        },
+        'limit': limit,
+        'added': side(added, '_target'),
+        'removed': side(removed, '_base'),
+        'changed': changes,
+        'drift': _stats_drift(calculate_summary_stats(base), calculate_summary_stats(target)),
+    }
+
+
+def parse_compare_params(query_params):
+    """
+    Validate ``base``, ``target`` and ``limit`` query parameters
+
+    Returns (base_id, target_id, limit, error); error is a message when
+    they are invalid.
+    """
+    try:
+        base_id = int(query_params['base'])
+        target_id = int(query_params['target'])
+    except (KeyError, ValueError):
+        return None, None, None, "'base' and 'target' dataset ids are required"
+    if not (1 <= base_id <= MAX_ID and 1 <= target_id <= MAX_ID):
+        return None, None, None, f"'base' and 'target' must be integers between 1 and {MAX_ID}"
+
+    try:
+        limit = int(query_params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = -1
+    if not 0 <= limit <= MAX_LIMIT:
+        return None, None, None, f"'limit' must be an integer between 0 and {MAX_LIMIT}"
+
+    return base_id, target_id, limit, None
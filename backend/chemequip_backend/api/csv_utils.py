@@ -0,0 +1,211 @@
+"""
+CSV parsing and statistics helpers
+
+Pure pandas/NumPy code with no Django dependencies, so it can also run in
+worker processes that never set up Django.
+"""
+import io
+import pandas as pd
+import numpy as np
+from chemequip_backend.api.quantiles import array_sketch, empty_sketch, merge_sketches, sketch_quantiles
+
+
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+
+# CSV column -> Equipment field for the numeric parameters
+NUMERIC_COLUMNS = {
+    'Flowrate': 'flowrate',
+    'Pressure': 'pressure',
+    'Temperature': 'temperature',
+}
+PARAMETERS = list(NUMERIC_COLUMNS.values())
+
+
+class CSVRowError(ValueError):
+    """Raised when a CSV row cannot be converted to an Equipment record"""
+
+
+def convert_frame(df, row_offset=0):
+    """
+    Convert a validated CSV DataFrame into Equipment field columns
+
+    Names and types are stripped strings; numeric columns are coerced to
+    float64 in one vectorized step, with NaN for missing values. Raises
+    CSVRowError naming the first row that is not numeric.
+    """
+    frame = pd.DataFrame({
+        'name': df['Equipment Name'].fillna('').astype(str).str.strip(),
+        'equipment_type': df['Type'].fillna('').astype(str).str.strip(),
+    })
+
+    for column, field in NUMERIC_COLUMNS.items():
+        values = pd.to_numeric(df[column], errors='coerce').astype('float64')
+        invalid = values.isna() & df[column].notna()
+        if invalid.any():
+            position = int(np.flatnonzero(invalid.to_numpy())[0])
+            raise CSVRowError(
+                f"Error processing row {row_offset + position + 1}: "
+                f"invalid {column} value {df[column].iloc[position]!r}"
+            )
+        frame[field] = values
+
+    return frame
+
+
+def empty_stats_state():
+    """
+    Return an accumulator for the statistics of zero rows
+    """
+    state = {'count': 0, 'types': {}}
+    for field in PARAMETERS:
+        state[field] = {
+            'count': 0, 'sum': 0.0, 'sum_sq': 0.0, 'min': None, 'max': None, 'sketch': empty_sketch()
+        }
+    return state
+
+
+def has_sketches(state):
+    """
+    Whether a statistics accumulator carries quantile sketches
+
+    States stored before sketches were added lack them until backfilled.
+    """
+    return bool(state) and all(state[field].get('sketch') is not None for field in PARAMETERS)
+
+
+def array_stats_state(values, type_counts):
+    """
+    Compute the statistics accumulator of a (rows x PARAMETERS) float array
+
+    NaN marks a missing value; ``type_counts`` maps equipment type to count.
+    """
+    values = np.asarray(values, dtype='float64')
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+
+    counts = present.sum(axis=0)
+    sums = filled.sum(axis=0)
+    sums_sq = (filled * filled).sum(axis=0)
+    mins = np.where(present, values, np.inf).min(axis=0, initial=np.inf)
+    maxs = np.where(present, values, -np.inf).max(axis=0, initial=-np.inf)
+
+    state = {
+        'count': len(values),
+        'types': {key: int(n) for key, n in type_counts.items()},
+    }
+    for i, field in enumerate(PARAMETERS):
+        count = int(counts[i])
+        state[field] = {
+            'count': count,
+            'sum': float(sums[i]),
+            'sum_sq': float(sums_sq[i]),
+            'min': float(mins[i]) if count else None,
+            'max': float(maxs[i]) if count else None,
+            'sketch': array_sketch(values[:, i]),
+        }
+    return state
+
+
+def frame_stats_state(frame):
+    """
+    Compute the statistics accumulator of a converted frame in one pass
+    """
+    return array_stats_state(
+        frame[PARAMETERS].to_numpy(dtype='float64'),
+        frame['equipment_type'].value_counts()
+    )
+
+
+def merge_stats_states(states):
+    """
+    Combine statistics accumulators as if their rows were one table
+    """
+    merged = empty_stats_state()
+    states = [state for state in states if state]
+    for field in PARAMETERS:
+        sketches = [state[field].get('sketch') for state in states]
+        # Without every part's sketch the merged quantiles would be wrong
+        merged[field]['sketch'] = None if None in sketches else merge_sketches(sketches)
+    for state in states:
+        merged['count'] += state['count']
+        for key, n in state['types'].items():
+            merged['types'][key] = merged['types'].get(key, 0) + n
+        for field in PARAMETERS:
+            total, part = merged[field], state[field]
+            total['count'] += part['count']
+            total['sum'] += part['sum']
+            total['sum_sq'] += part['sum_sq']
+            for bound, pick in (('min', min), ('max', max)):
+                if part[bound] is not None:
+                    total[bound] = part[bound] if total[bound] is None else pick(total[bound], part[bound])
+    return merged
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def summarize_stats_state(state):
+    """
+    Turn a statistics accumulator into the summary_stats dictionary
+
+    Medians and p95s come from the quantile sketches (within 1%, see
+    quantiles.py) and are None when the state has no sketch.
+    """
+    if not state or not state['count']:
+        return {}
+
+    stats = {
+        'total_equipment': state['count'],
+        'equipment_type_distribution': dict(state['types']),
+        'null_counts': {},
+    }
+    for field in PARAMETERS:
+        part = state[field]
+        n = part['count']
+        std = None
+        if n > 1:
+            variance = (part['sum_sq'] - part['sum'] ** 2 / n) / (n - 1)
+            std = max(variance, 0.0) ** 0.5
+        stats[f'avg_{field}'] = round(part['sum'] / n, 2) if n else 0
+        stats[f'min_{field}'] = _round(part['min'])
+        stats[f'max_{field}'] = _round(part['max'])
+        stats[f'std_{field}'] = _round(std)
+        # Estimates never fall outside the exact range of the values
+        for name, value in zip(('median', 'p95'), sketch_quantiles(part.get('sketch'), [0.5, 0.95])):
+            if value is not None and n:
+                value = min(max(value, part['min']), part['max'])
+            stats[f'{name}_{field}'] = _round(value)
+        stats['null_counts'][field] = state['count'] - n
+    return stats
+
+
+def read_csv_batches(file_obj, batch_size):
+    """
+    Yield the CSV file as DataFrames of at most ``batch_size`` rows
+
+    Only one batch is held in memory at a time, whatever the file size.
+    """
+    file_obj.seek(0)
+    with pd.read_csv(file_obj, chunksize=batch_size, encoding='utf-8') as reader:
+        yield from reader
+
+
+def parse_csv_bytes(name, data):
+    """
+    Parse one CSV file held in memory into a converted frame and its statistics
+
+    Returns (name, frame, state, error) with error set instead of raising,
+    so it can be mapped over a process pool.
+    """
+    try:
+        df = pd.read_csv(io.BytesIO(data), encoding='utf-8')
+        if not all(col in df.columns for col in REQUIRED_COLUMNS):
+            return name, None, None, f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}"
+        frame = convert_frame(df)
+    except CSVRowError as e:
+        return name, None, None, str(e)
+    except Exception as e:
+        return name, None, None, f"Error processing CSV: {str(e)}"
+
+    return name, frame, frame_stats_state(frame), None
@@ -0,0 +1,134 @@
+"""
+File download helpers: conditional requests, byte ranges and sendfile offload
+"""
+import hashlib
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 2 ** 10
+
+
+def _parse_range(header, size):
+    """
+    Parse a single-range Range header into (start, end) inclusive
+
+    Returns None when the header should be ignored (absent, malformed or
+    multiple ranges) and 'unsatisfiable' when it cannot be served.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return 'unsatisfiable'
+    return start, end
+
+
+def _iter_range(file_obj, start, length):
+    with file_obj:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = file_obj.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _sendfile_response(field_file, content_type):
+    """
+    Return an empty response telling the front proxy to send the file, or None
+
+    settings.DATASET_SENDFILE selects the header: 'x-sendfile' (Apache,
+    lighttpd) carries the filesystem path; 'x-accel-redirect' (nginx)
+    carries DATASET_SENDFILE_PREFIX plus the storage name and must map to
+    an internal location.
+    """
+    backend = getattr(settings, 'DATASET_SENDFILE', None)
+    if not backend:
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if backend == 'x-sendfile':
+        response['X-Sendfile'] = field_file.path
+    elif backend == 'x-accel-redirect':
+        prefix = getattr(settings, 'DATASET_SENDFILE_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(field_file.name)
+    else:
+        return None
+    return response
+
+
+def file_download_response(request, field_file, filename, content_type, etag=None):
+    """
+    Serve a stored file with validators, Range support and optional offload
+
+    Sends strong ETag and Last-Modified validators and answers
+    If-None-Match / If-Modified-Since with 304. A single byte range is
+    served as 206, and an unsatisfiable one as 416; If-Range is honoured.
+    When DATASET_SENDFILE is configured the body is left to the proxy.
+    ``etag`` overrides the default tag derived from name, size and mtime,
+    e.g. for content-addressed files.
+    """
+    storage = field_file.storage
+    size = field_file.size
+    modified = storage.get_modified_time(field_file.name)
+    last_modified = int(modified.timestamp())
+    etag = etag or '"%s"' % hashlib.md5(
+        f'{field_file.name}:{size}:{modified.timestamp()}'.encode()
+    ).hexdigest()
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return conditional
+
+    disposition = f'attachment; filename="{filename}"'
+    response = _sendfile_response(field_file, content_type)
+
+    if response is None:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or if_range in (etag, http_date(last_modified)):
+            byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_range(field_file.open('rb'), start, length),
+                status=206,
+                content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(field_file.open('rb'), content_type=content_type)
+
+    response['Content-Disposition'] = disposition
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
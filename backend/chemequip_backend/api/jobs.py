@@ -0,0 +1,200 @@
+"""
+Database-backed job queue for background processing
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+from chemequip_backend.api.models import Job
+from chemequip_backend.api.utils import ingest_csv_dataset, apply_dataset_retention
+from chemequip_backend.api.pdf_utils import get_pdf_report
+
+# Minimum seconds between job progress writes for page updates
+PROGRESS_INTERVAL = 0.5
+
+
+def enqueue_csv_ingest(user, file_obj):
+    """
+    Store an uploaded CSV file and queue it for ingest
+    """
+    return Job.objects.create(
+        user=user,
+        kind=Job.KIND_INGEST_CSV,
+        filename=file_obj.name,
+        file=file_obj
+    )
+
+
+def enqueue_pdf_report(user, dataset, summary_only=False):
+    """
+    Queue generation of a dataset's PDF report
+    """
+    return Job.objects.create(
+        user=user,
+        kind=Job.KIND_PDF_REPORT,
+        filename=f"Report_{dataset.filename.replace('.csv', '')}.pdf",
+        dataset=dataset,
+        options={'summary_only': summary_only}
+    )
+
+
+def expire_stale_jobs():
+    """
+    Release running jobs whose worker has been gone for too long
+
+    A job still running JOB_TIMEOUT seconds after it was claimed is taken
+    to belong to a worker that was killed or lost its connection. It goes
+    back to the queue, or fails once it has been claimed JOB_MAX_ATTEMPTS
+    times. Returns the number of jobs released.
+    """
+    timeout = getattr(settings, 'JOB_TIMEOUT', 3600)
+    if timeout is None:
+        return 0
+
+    now = timezone.now()
+    stale = Job.objects.filter(state=Job.STATE_RUNNING, started_at__lt=now - timedelta(seconds=timeout))
+    max_attempts = getattr(settings, 'JOB_MAX_ATTEMPTS', 2)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        state=Job.STATE_FAILED,
+        error=f'Job did not finish within {timeout} seconds',
+        finished_at=now
+    )
+    requeued = stale.update(state=Job.STATE_QUEUED, started_at=None, progress={})
+    return failed + requeued
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to running and return it
+
+    The claim is a conditional UPDATE on the job's state, so concurrent
+    workers (threads or processes) never pick up the same job. Stale
+    running jobs are released first (see expire_stale_jobs). Returns None
+    when the queue is empty.
+    """
+    expire_stale_jobs()
+    while True:
+        job_id = (
+            Job.objects.filter(state=Job.STATE_QUEUED)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        claimed = Job.objects.filter(id=job_id, state=Job.STATE_QUEUED).update(
+            state=Job.STATE_RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+
+
+def run_ingest_job(job):
+    """
+    Load a queued CSV file into a new Dataset
+
+    The job lets go of its file either way: the new dataset refers to it,
+    and otherwise collect_orphaned_files removes it.
+    """
+    try:
+        with job.file.open('rb') as file_obj:
+            dataset, message = ingest_csv_dataset(job.user, file_obj, job.filename)
+    finally:
+        job.file = ''
+
+    if dataset is None:
+        raise ValueError(message)
+
+    apply_dataset_retention(job.user)
+
+    job.dataset = dataset
+    job.rows_processed = dataset.equipment_count
+
+
+def run_pdf_report_job(job):
+    """
+    Render a dataset's PDF report into the report cache
+
+    Progress is written to the job as sections and pages are finished
+    (at most every PROGRESS_INTERVAL seconds for pages), so clients
+    polling the job can follow it.
+    """
+    if job.dataset is None:
+        raise ValueError('Dataset not found')
+
+    last_saved = [0.0]
+
+    def progress(state):
+        section_done = state['sections_done'] != job.progress.get('sections_done')
+        job.progress = state
+        now = time.monotonic()
+        if section_done or now - last_saved[0] >= PROGRESS_INTERVAL:
+            last_saved[0] = now
+            Job.objects.filter(id=job.id).update(progress=state)
+
+    get_pdf_report(job.dataset, job.options.get('summary_only', False), progress)
+    job.rows_processed = job.dataset.equipment_count
+
+
+JOB_RUNNERS = {
+    Job.KIND_INGEST_CSV: run_ingest_job,
+    Job.KIND_PDF_REPORT: run_pdf_report_job,
+}
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome
+
+    The outcome is only written while this claim still holds; a job that
+    was released by expire_stale_jobs in the meantime is left as it is.
+    """
+    try:
+        JOB_RUNNERS[job.kind](job)
+    except Exception as e:
+        job.state = Job.STATE_FAILED
+        job.error = str(e)
+    else:
+        job.state = Job.STATE_SUCCEEDED
+
+    job.finished_at = timezone.now()
+    updated = Job.objects.filter(id=job.id, state=Job.STATE_RUNNING, attempts=job.attempts).update(
+        state=job.state,
+        error=job.error,
+        finished_at=job.finished_at,
+        dataset=job.dataset,
+        file=job.file,
+        rows_processed=job.rows_processed,
+        progress=job.progress
+    )
+    if not updated:
+        job.refresh_from_db()
+    return job
+
+
+def run_worker(stop_when_empty=False, poll_interval=2.0, stop_event=None):
+    """
+    Claim and run jobs until the queue is empty or ``stop_event`` is set
+    """
+    while stop_event is None or not stop_event.is_set():
+        # Long-running workers drop broken or expired connections between
+        # jobs; skipped when running inside a caller's transaction
+        if not connection.in_atomic_block:
+            close_old_connections()
+        job = claim_next_job()
+
+        if job is not None:
+            run_job(job)
+            continue
+
+        if stop_when_empty:
+            break
+        if stop_event is not None:
+            stop_event.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
@@ -0,0 +1,35 @@
+"""
+Django management command to complete stored dataset statistics states
+"""
+from django.core.management.base import BaseCommand
+from chemequip_backend.api.cache_utils import bump_data_version
+from chemequip_backend.api.csv_utils import has_sketches, summarize_stats_state
+from chemequip_backend.api.models import Dataset
+from chemequip_backend.api.utils import compute_dataset_stats_state
+
+
+class Command(BaseCommand):
+    help = 'Compute the statistics state and quantile sketches of datasets stored without them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute every dataset, not only incomplete ones'
+        )
+
+    def handle(self, *args, **options):
+        updated = 0
+        datasets = Dataset.objects.order_by('id').only('id', 'user_id', 'file', 'stats_state')
+        for dataset in datasets.iterator(chunk_size=100):
+            if has_sketches(dataset.stats_state) and not options['force']:
+                continue
+
+            state = compute_dataset_stats_state(dataset)
+            Dataset.objects.filter(id=dataset.id).update(
+                stats_state=state, summary_stats=summarize_stats_state(state)
+            )
+            bump_data_version(dataset.user_id)
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} datasets'))
@@ -0,0 +1,95 @@
+"""
+Django management command to benchmark equipment serialization paths
+"""
+import io
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from chemequip_backend.api.models import Dataset, Equipment
+from chemequip_backend.api.renderers import FastJSONRenderer, orjson
+from chemequip_backend.api.serializers import EquipmentSerializer, EquipmentRowSerializer
+from chemequip_backend.api.utils import process_csv_file
+
+TYPES = [name for name, _ in Equipment.EQUIPMENT_TYPES]
+# Equipment name patterns benchmarked; 'valve' names contain 'e-' and 'e0'
+NAME_FORMATS = {
+    'unit': 'Unit-{:06d}',
+    'valve': 'Valve-{:02d}',
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare EquipmentSerializer + JSONRenderer with the values_list() fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help='Row counts to benchmark'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per path; the best time is reported'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"JSON encoder: {'orjson ' + orjson.__version__ if orjson else 'json (orjson not installed)'}")
+        self.stdout.write(f"{'rows':>8}  {'names':>6}  {'serializer':>11}  {'fast path':>10}  {'speedup':>8}")
+
+        # Benchmark rows are created in a transaction that is always rolled back
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username='__benchmark_serialization__')
+                for rows in options['rows']:
+                    for names, name_format in NAME_FORMATS.items():
+                        # Load through the CSV ingest so rows look like uploaded ones
+                        dataset = Dataset.objects.create(user=user, filename='benchmark.csv')
+                        success, message = process_csv_file(self.make_csv(rows, name_format), dataset)
+                        if not success:
+                            raise CommandError(message)
+                        self.benchmark(dataset.equipment.order_by('name', 'id'), rows, names, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def make_csv(self, rows, name_format):
+        lines = ['Equipment Name,Type,Flowrate,Pressure,Temperature']
+        for i in range(rows):
+            temperature = '' if i % 50 == 0 else 20 + (i % 313) * 0.29
+            lines.append(f'{name_format.format(i)},{TYPES[i % len(TYPES)]},{100 + i * 0.37},{5 + (i % 97) * 0.11},{temperature}')
+        return io.BytesIO('\n'.join(lines).encode())
+
+    def benchmark(self, queryset, rows, names, repeat):
+        def serializer_path():
+            return JSONRenderer().render(EquipmentSerializer(list(queryset), many=True).data)
+
+        def fast_path():
+            serializer = EquipmentRowSerializer()
+            page = list(queryset.values_list(*serializer.fields))
+            return FastJSONRenderer().render(serializer.to_representation(page))
+
+        slow, slow_output = self.time(serializer_path, repeat)
+        fast, fast_output = self.time(fast_path, repeat)
+        if slow_output != fast_output:
+            self.stderr.write(self.style.ERROR(f'{rows} rows ({names} names): outputs differ'))
+
+        self.stdout.write(f'{rows:>8}  {names:>6}  {slow:>10.3f}s  {fast:>9.3f}s  {slow / fast:>7.1f}x')
+
+    def time(self, func, repeat):
+        best, output = None, None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
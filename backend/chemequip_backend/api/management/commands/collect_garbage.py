@@ -0,0 +1,46 @@
+"""
+Django management command to delete stored files nothing refers to any more
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chemequip_backend.api.pdf_utils import collect_orphaned_reports
+from chemequip_backend.api.utils import collect_orphaned_files
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded CSV files, columnar sidecars and PDF reports left by deleted datasets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=getattr(settings, 'GC_MIN_AGE', 3600),
+            help='Only delete files not modified for this many seconds'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Paths checked against the database per query'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting it'
+        )
+
+    def handle(self, *args, **options):
+        kwargs = {
+            'min_age': options['min_age'],
+            'batch_size': max(options['batch_size'], 1),
+            'dry_run': options['dry_run'],
+        }
+        files = collect_orphaned_files(**kwargs)
+        reports = collect_orphaned_reports(**kwargs)
+
+        freed = (files['bytes'] + reports['bytes']) / 2 ** 20
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {files['files']} files, {files['sidecars']} sidecars and "
+            f"{reports['reports']} reports ({freed:.1f} MB)"
+        ))
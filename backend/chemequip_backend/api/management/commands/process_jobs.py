@@ -0,0 +1,72 @@
+"""
+Django management command to run the background job workers
+"""
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from chemequip_backend.api.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of workers that process queued jobs (CSV ingest, PDF reports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'JOB_WORKERS', 2),
+            help='Number of worker threads'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=getattr(settings, 'JOB_POLL_INTERVAL', 2.0),
+            help='Seconds to wait before checking an empty queue again'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        worker_options = {
+            'stop_when_empty': options['once'],
+            'poll_interval': options['poll_interval'],
+        }
+
+        if workers == 1:
+            self.stdout.write('Processing jobs with 1 worker')
+            try:
+                run_worker(**worker_options)
+            except KeyboardInterrupt:
+                pass
+            self.stdout.write(self.style.SUCCESS('Job worker stopped'))
+            return
+
+        stop_event = threading.Event()
+
+        def work():
+            try:
+                run_worker(stop_event=stop_event, **worker_options)
+            finally:
+                # Each thread owns its own database connection
+                connection.close()
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        self.stdout.write(f'Processing jobs with {workers} workers')
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS('Job workers stopped'))
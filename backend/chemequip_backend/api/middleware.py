@@ -0,0 +1,75 @@
+"""
+Middleware for per-request SQL query instrumentation
+"""
+import logging
+import time
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """
+    Context manager that counts queries and SQL time on a database connection
+
+    Installs a connection execute wrapper, so it works with DEBUG off and
+    adds no cost outside the ``with`` block.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+            self.queries.append(sql)
+
+    def __enter__(self):
+        self._wrapper = connections[self.using].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the number of SQL queries and total SQL time of each request
+
+    Enabled by settings.QUERY_INSTRUMENTATION. The numbers are returned in
+    the X-Query-Count and X-Query-Time-Ms response headers, and requests
+    that run more than settings.QUERY_BUDGET queries are logged as
+    warnings. Queries issued while a streaming response is being consumed
+    happen after the view returns and are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.2f}'
+
+        budget = getattr(settings, 'QUERY_BUDGET', None)
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                '%s %s ran %d queries (budget %d)',
+                request.method, request.path, recorder.count, budget
+            )
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='stats_state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.8 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'name', 'id'], name='api_equipme_dataset_c365bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['name', 'id'], name='api_equipme_name_ab28f3_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.8 on 2026-10-18 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_dataset_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='equipment',
+            options={'ordering': ['name', 'id'], 'verbose_name': 'Equipment', 'verbose_name_plural': 'Equipment'},
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['user', '-uploaded_at'], name='api_dataset_user_id_82ccec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'equipment_type', 'name', 'id'], name='api_equipme_dataset_285153_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'flowrate', 'id'], name='api_equipme_dataset_f20a5e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'pressure', 'id'], name='api_equipme_dataset_e6b35a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'temperature', 'id'], name='api_equipme_dataset_72c172_idx'),
+        ),
+    ]
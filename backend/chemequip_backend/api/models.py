@@ -21,8 +21,20 @@ class Dataset(models.Model):
     # Equipment count
     equipment_count = models.IntegerField(default=0)
     
+    # SHA-256 of the uploaded file, used to deduplicate re-uploads
+    content_hash = models.CharField(max_length=64, blank=True)
+    
+    # Mergeable statistics accumulator (count, sum, sum of squares, min,
+    # max per parameter and per-type counts) written at ingest
+    stats_state = models.JSONField(default=dict, blank=True)
+    
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['user', 'content_hash']),
+            # History listings, newest first, and retention
+            models.Index(fields=['user', '-uploaded_at']),
+        ]
         verbose_name = 'Dataset'
         verbose_name_plural = 'Datasets'
     
@@ -54,9 +66,94 @@ class Equipment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['name']
+        ordering = ['name', 'id']
+        indexes = [
+            # Keyset pagination within a dataset and across a user's datasets
+            models.Index(fields=['dataset', 'name', 'id']),
+            models.Index(fields=['name', 'id']),
+            # Type filters and range filters / ordering on each parameter
+            models.Index(fields=['dataset', 'equipment_type', 'name', 'id']),
+            models.Index(fields=['dataset', 'flowrate', 'id']),
+            models.Index(fields=['dataset', 'pressure', 'id']),
+            models.Index(fields=['dataset', 'temperature', 'id']),
+        ]
         verbose_name = 'Equipment'
         verbose_name_plural = 'Equipment'
     
     def __str__(self):
         return f"{self.name} ({self.equipment_type})"
+
+
+class Job(models.Model):
+    """
+    Model to store background jobs run by the process_jobs command
+    """
+    KIND_INGEST_CSV = 'ingest_csv'
+    KIND_PDF_REPORT = 'pdf_report'
+    KINDS = [
+        (KIND_INGEST_CSV, 'Ingest CSV'),
+        (KIND_PDF_REPORT, 'PDF report'),
+    ]
+    
+    STATE_QUEUED = 'queued'
+    STATE_RUNNING = 'running'
+    STATE_SUCCEEDED = 'succeeded'
+    STATE_FAILED = 'failed'
+    STATES = [
+        (STATE_QUEUED, 'Queued'),
+        (STATE_RUNNING, 'Running'),
+        (STATE_SUCCEEDED, 'Succeeded'),
+        (STATE_FAILED, 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=50, choices=KINDS)
+    state = models.CharField(max_length=20, choices=STATES, default=STATE_QUEUED)
+    
+    # Input file and the dataset it produced (or, for reports, the input dataset)
+    filename = models.CharField(max_length=255, blank=True)
+    file = models.FileField(upload_to='jobs/%Y/%m/%d/', blank=True)
+    dataset = models.ForeignKey(Dataset, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    
+    # Kind-specific parameters, e.g. {"summary_only": true} for reports
+    options = models.JSONField(default=dict, blank=True)
+    
+    rows_processed = models.IntegerField(default=0)
+    # Progress reported while running, e.g. sections and pages rendered
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Number of times a worker has claimed the job
+    attempts = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['state', 'created_at']),
+        ]
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.state})"
+
+
+class DataVersion(models.Model):
+    """
+    Model to store each user's data version, used to validate cached responses
+
+    The version is replaced in the same transaction that changes the
+    user's datasets, so every process sees the change once it commits.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='data_version')
+    version = models.CharField(max_length=32)
+    
+    class Meta:
+        verbose_name = 'Data version'
+        verbose_name_plural = 'Data versions'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.version}"
@@ -0,0 +1,240 @@
+"""
+Pagination classes for the API
+"""
+import base64
+import binascii
+import json
+import math
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from chemequip_backend.api.filters import MAX_ID
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over a unique ordering such as (name, id)
+
+    Each page is fetched with a WHERE clause that starts right after the
+    last row of the previous page, so every page costs one index range
+    scan no matter how deep it is. There is no OFFSET, and the total count
+    is only computed when the client asks for it with ``?count=true``.
+
+    The ordering comes from the view's ``keyset_ordering`` attribute (or
+    ``ordering`` below); it must end with a unique field. Fields prefixed
+    with ``-`` are descending. Nullable fields sort NULLs first ascending
+    and last descending, SQLite's native order, so an index on the field
+    still serves the ordering. Querysets may yield model instances,
+    values() dicts or values_list() tuples that include the ordering fields.
+    """
+    ordering = ('name', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            self.check_position(queryset.model, position)
+        # Column names of values_list() rows, which are plain tuples
+        self.row_fields = tuple(queryset.query.values_select)
+        self.nullable = {
+            field.lstrip('-') for field in self.ordering
+            if self._is_nullable(queryset.model, field.lstrip('-'))
+        }
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+
+        if position is not None:
+            queryset = queryset.filter(self._after_position(position, reverse))
+
+        order_by = [self._order_expression(field, reverse) for field in self.ordering]
+        rows = list(queryset.order_by(*order_by)[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first_position = self._row_position(rows[0]) if rows else None
+        self.last_position = self._row_position(rows[-1]) if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        fields = []
+        if self.count is not None:
+            fields.append(('count', self.count))
+        fields += [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        return Response(OrderedDict(fields))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = remove_query_param(self.base_url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """
+        Return (position, reverse) from the request's cursor, or (None, False)
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            position = payload['p']
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def check_position(self, model, position):
+        """
+        Reject cursor values that do not fit their ordering field's type
+
+        Strings for text fields, finite numbers for float fields and
+        integers the database can store for integer fields; None only
+        where the field is nullable.
+        """
+        for field, value in zip(self.ordering, position):
+            try:
+                model_field = model._meta.get_field(field.lstrip('-'))
+            except FieldDoesNotExist:
+                continue
+
+            if value is None:
+                valid = model_field.null
+            elif isinstance(value, bool):
+                valid = False
+            elif isinstance(model_field, models.IntegerField):
+                valid = isinstance(value, int) and -MAX_ID - 1 <= value <= MAX_ID
+            elif isinstance(model_field, models.FloatField):
+                valid = isinstance(value, (int, float)) and math.isfinite(value)
+            elif isinstance(model_field, (models.CharField, models.TextField)):
+                valid = isinstance(value, str)
+            else:
+                valid = True
+
+            if not valid:
+                raise NotFound(self.invalid_cursor_message)
+
+    def _row_position(self, row):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict):
+                values.append(row[name])
+            elif isinstance(row, tuple):
+                values.append(row[self.row_fields.index(name)])
+            else:
+                values.append(getattr(row, name))
+        return values
+
+    def _is_nullable(self, model, name):
+        try:
+            return model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    def _order_expression(self, field, reverse):
+        descending = field.startswith('-') != reverse
+        name = field.lstrip('-')
+        if name in self.nullable:
+            return F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True)
+        return f'-{name}' if descending else name
+
+    def _compare(self, name, value, descending, inclusive):
+        """
+        Q for rows whose ``name`` comes after ``value`` (NULL sorts lowest)
+        """
+        nullable = name in self.nullable
+        if value is None:
+            if descending:
+                # Nothing comes after NULL when descending
+                return Q(**{f'{name}__isnull': True}) if inclusive else None
+            return Q() if inclusive else Q(**{f'{name}__isnull': False})
+
+        lookup = ('lt' if descending else 'gt') + ('e' if inclusive else '')
+        condition = Q(**{f'{name}__{lookup}': value})
+        if descending and nullable:
+            condition |= Q(**{f'{name}__isnull': True})
+        return condition
+
+    def _after_position(self, position, reverse):
+        """
+        Build the filter selecting rows strictly after ``position``
+
+        Expands (a, b, c) > (x, y, z) into ORed equality prefixes, plus a
+        leading a >= x so the database can seek on the first column.
+        """
+        conditions = []
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            after = self._compare(name, value, descending, inclusive=False)
+            if after is not None:
+                conditions.append(equal & after)
+            equal &= Q(**{f'{name}__isnull': True} if value is None else {name: value})
+
+        if not conditions:
+            return Q(pk__in=[])
+
+        first = self.ordering[0]
+        seek = self._compare(
+            first.lstrip('-'), position[0], first.startswith('-') != reverse, inclusive=True
+        )
+        return seek & reduce(or_, conditions)
@@ -4,28 +4,155 @@ PDF generation utilities
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, PageBreak, Flowable
 from reportlab.lib.units import inch
-from io import BytesIO
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models.fields.files import FieldFile
 from chemequip_backend.api.models import Dataset
+from chemequip_backend.api.utils import calculate_summary_stats
 from datetime import datetime
+import hashlib
+import itertools
+import json
+import os
+import time
 
+# Bump whenever the report layout changes so cached PDFs are rebuilt
+REPORT_TEMPLATE_VERSION = 2
 
-def generate_pdf_report(dataset_id, user):
+DETAIL_COLUMNS = ['name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
+DETAIL_HEADER = ['Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+DETAIL_COL_WIDTHS = [1.5*inch, 1.5*inch, 1.2*inch, 1.2*inch, 1.2*inch]
+DETAIL_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F0F4F8')]),
+])
+
+
+def _detail_row_limit(summary_only):
+    if summary_only:
+        return 0
+    return getattr(settings, 'PDF_MAX_DETAIL_ROWS', None)
+
+
+def _detail_tables(dataset, max_rows):
     """
-    Generate a PDF report for a dataset
+    Yield the equipment details as page-sized LongTable chunks
+
+    Rows are read lazily with values_list(), and keeping every table about
+    a page long avoids ReportLab re-measuring one huge table on each page
+    break, which makes layout time grow quadratically with the row count.
     """
-    try:
-        dataset = Dataset.objects.get(id=dataset_id, user=user)
-    except Dataset.DoesNotExist:
-        return None, "Dataset not found"
+    chunk_rows = getattr(settings, 'PDF_TABLE_CHUNK_ROWS', 25)
+    rows = dataset.equipment.order_by('name', 'id').values_list(*DETAIL_COLUMNS).iterator(chunk_size=2000)
+    if max_rows is not None:
+        rows = itertools.islice(rows, max_rows)
+    
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            return
+        data = [DETAIL_HEADER]
+        for name, equipment_type, flowrate, pressure, temperature in chunk:
+            data.append([
+                name,
+                equipment_type,
+                f"{flowrate}" if flowrate else 'N/A',
+                f"{pressure}" if pressure else 'N/A',
+                f"{temperature}" if temperature else 'N/A',
+            ])
+        table = LongTable(data, colWidths=DETAIL_COL_WIDTHS, repeatRows=1)
+        table.setStyle(DETAIL_TABLE_STYLE)
+        yield table
+
+
+class ReportProgress:
+    """
+    Track sections and pages rendered while a report is built
+
+    ``callback`` receives a dict with ``sections_done``, ``sections_total``,
+    ``section`` (the last one finished), ``pages`` and ``pages_estimated``
+    each time a section ends or a page is finished.
+    """
+    
+    def __init__(self, callback, sections, pages_estimated):
+        self.callback = callback
+        self.state = {
+            'sections_done': 0,
+            'sections_total': len(sections),
+            'section': None,
+            'pages': 0,
+            'pages_estimated': pages_estimated,
+        }
+    
+    def section_done(self, name):
+        self.state['sections_done'] += 1
+        self.state['section'] = name
+        self.callback(dict(self.state))
+    
+    def on_layout(self, kind, value):
+        # ReportLab progress callback; 'PAGE' is sent as each page is finished
+        if kind == 'PAGE':
+            self.state['pages'] = value
+            self.callback(dict(self.state))
+
+
+class SectionEnd(Flowable):
+    """
+    Zero-size flowable telling a ReportProgress that layout finished a section
+    """
+    
+    def __init__(self, progress, name):
+        super().__init__()
+        self.progress = progress
+        self.name = name
+    
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+    
+    def draw(self):
+        self.progress.section_done(self.name)
+
+
+def generate_pdf_report(dataset, output, stats=None, summary_only=False, progress=None):
+    """
+    Generate a PDF report for a dataset into ``output`` (a path or binary file)
+
+    The equipment details section lists at most settings.PDF_MAX_DETAIL_ROWS
+    rows and is left out entirely when ``summary_only`` is set. ``progress``
+    is an optional callback, see ReportProgress.
+    """
+    # Datasets ingested before stats were stored at upload time fall back
+    # to the database aggregation
+    stats = stats or dataset.summary_stats or calculate_summary_stats(dataset)
     
-    # Create PDF buffer
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    max_rows = _detail_row_limit(summary_only)
+    detail_rows = dataset.equipment_count if max_rows is None else min(max_rows, dataset.equipment_count)
+    sections = ['information', 'statistics', 'distribution']
+    if max_rows != 0:
+        sections.append('details')
+    
+    doc = SimpleDocTemplate(output, pagesize=letter)
     elements = []
     
+    tracker = None
+    if progress is not None:
+        chunk_rows = getattr(settings, 'PDF_TABLE_CHUNK_ROWS', 25)
+        tracker = ReportProgress(progress, sections, 1 + (detail_rows + chunk_rows - 1) // chunk_rows)
+        doc.setProgressCallBack(tracker.on_layout)
+    
+    def end_section(name):
+        if tracker is not None:
+            elements.append(SectionEnd(tracker, name))
+    
     # Get styles
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
@@ -69,10 +196,10 @@ def generate_pdf_report(dataset_id, user):
     ]))
     elements.append(info_table)
     elements.append(Spacer(1, 0.3*inch))
+    end_section('information')
     
     # Summary Statistics
     elements.append(Paragraph("Summary Statistics", heading_style))
-    stats = dataset.summary_stats
     
     stats_data = [
         ['Metric', 'Value'],
@@ -101,6 +228,7 @@ def generate_pdf_report(dataset_id, user):
     ]))
     elements.append(stats_table)
     elements.append(Spacer(1, 0.3*inch))
+    end_section('statistics')
     
     # Equipment Type Distribution
     elements.append(Paragraph("Equipment Type Distribution", heading_style))
@@ -123,38 +251,164 @@ def generate_pdf_report(dataset_id, user):
     ]))
     elements.append(dist_table)
     elements.append(Spacer(1, 0.3*inch))
+    end_section('distribution')
     
     # Equipment Details
-    elements.append(PageBreak())
-    elements.append(Paragraph("Equipment Details", heading_style))
-    
-    equipment_list = dataset.equipment.all()
-    equip_data = [['Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']]
-    for equip in equipment_list:
-        equip_data.append([
-            equip.name,
-            equip.equipment_type,
-            f"{equip.flowrate}" if equip.flowrate else 'N/A',
-            f"{equip.pressure}" if equip.pressure else 'N/A',
-            f"{equip.temperature}" if equip.temperature else 'N/A',
-        ])
-    
-    equip_table = Table(equip_data, colWidths=[1.5*inch, 1.5*inch, 1.2*inch, 1.2*inch, 1.2*inch])
-    equip_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F0F4F8')]),
-    ]))
-    elements.append(equip_table)
+    if max_rows != 0:
+        elements.append(PageBreak())
+        elements.append(Paragraph("Equipment Details", heading_style))
+        if max_rows is not None and dataset.equipment_count > max_rows:
+            elements.append(Paragraph(
+                f"Showing the first {max_rows} of {dataset.equipment_count} equipment records. "
+                "Download the dataset for the full list.",
+                styles['Normal']
+            ))
+            elements.append(Spacer(1, 0.1*inch))
+        elements.extend(_detail_tables(dataset, max_rows))
+        end_section('details')
     
     # Build PDF
     doc.build(elements)
-    buffer.seek(0)
+
+
+def report_cache_key(dataset, stats, summary_only=False):
+    """
+    Return the content hash identifying a dataset's report
+
+    Covers everything the report shows besides the equipment rows, which
+    never change after upload, plus the template version and the size of
+    the details section.
+    """
+    content = json.dumps({
+        'template': REPORT_TEMPLATE_VERSION,
+        'filename': dataset.filename,
+        'uploaded_at': dataset.uploaded_at.isoformat(),
+        'equipment_count': dataset.equipment_count,
+        'stats': stats,
+        'detail_rows': _detail_row_limit(summary_only),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def _report_dir():
+    return getattr(settings, 'PDF_CACHE_DIR', 'reports')
+
+
+def _evict_reports(keep):
+    """
+    Delete least recently used reports until the cache fits PDF_CACHE_MAX_SIZE
+    """
+    max_size = getattr(settings, 'PDF_CACHE_MAX_SIZE', None)
+    if not max_size:
+        return
+
+    directory = default_storage.path(_report_dir())
+    reports = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                reports.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in reports)
+    for _, size, path in sorted(reports):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def get_pdf_report(dataset, summary_only=False, progress=None):
+    """
+    Return (file, etag) for a dataset's PDF report, generating it if needed
+
+    Reports are stored under PDF_CACHE_DIR as ``<dataset id>-<content
+    hash>.pdf``, so a stale report is never served and the hash doubles
+    as a strong ETag. Hits refresh the file's mtime, which drives the
+    least-recently-used eviction. ``progress`` is passed on to
+    generate_pdf_report when the report has to be built.
+    """
+    stats = dataset.summary_stats or calculate_summary_stats(dataset)
+    key = report_cache_key(dataset, stats, summary_only)
+    name = f"{_report_dir()}/{dataset.id}-{key}.pdf"
+    path = default_storage.path(name)
+
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Render straight to a temporary file, renamed into place when
+        # complete so readers never see a partial report
+        tmp_path = f"{path}.tmp-{os.getpid()}-{id(stats)}"
+        try:
+            generate_pdf_report(dataset, tmp_path, stats, summary_only, progress)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _evict_reports(keep=path)
+
+    return FieldFile(dataset, Dataset.file.field, name), f'"{key}"'
+
+
+def collect_orphaned_reports(min_age=3600, batch_size=1000, dry_run=False):
+    """
+    Delete cached reports whose dataset no longer exists
+
+    Returns {'reports', 'bytes'}.
+    """
+    collected = {'reports': 0, 'bytes': 0}
+    cutoff = time.time() - min_age
+    try:
+        entries = [
+            entry for entry in os.scandir(default_storage.path(_report_dir()))
+            if entry.is_file() and entry.name.endswith('.pdf')
+        ]
+    except FileNotFoundError:
+        return collected
+    
+    def dataset_id(entry):
+        prefix = entry.name.split('-', 1)[0]
+        return int(prefix) if prefix.isdigit() else None
     
-    return buffer, "PDF generated successfully"
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        existing = set(
+            Dataset.objects.filter(id__in={dataset_id(entry) for entry in batch} - {None})
+            .values_list('id', flat=True)
+        )
+        for entry in batch:
+            if dataset_id(entry) in existing:
+                continue
+            try:
+                stat = entry.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            collected['reports'] += 1
+            collected['bytes'] += stat.st_size
+    
+    return collected
+
+
+def delete_dataset_reports(dataset):
+    """
+    Remove every cached report of a dataset
+    """
+    directory = default_storage.path(_report_dir())
+    prefix = f"{dataset.id}-"
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(prefix):
+                    os.remove(entry.path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,135 @@
+"""
+Mergeable quantile sketches for the dataset statistics accumulators
+
+A DDSketch-style sketch: every non-zero value is counted in a logarithmic
+bucket ``ceil(log_gamma(|v|))`` with ``gamma = (1 + a) / (1 - a)``, and
+zeros get their own counter. Merging two sketches adds their bucket
+counts, so the sketch of several datasets is exactly the sketch of their
+rows taken together, in any merge order.
+
+Error bound: a quantile read from a sketch is within RELATIVE_ACCURACY
+(1%) of the exact value at that rank (the lower nearest rank
+``floor(q * (n - 1))``), i.e. ``|estimate - exact| <= 0.01 * |exact|``.
+This holds while the non-zero values of each sign span fewer than about
+17 orders of magnitude (MAX_BUCKETS buckets); beyond that the buckets
+closest to zero are merged and only the quantiles there lose accuracy.
+Values with ``|v| < MIN_VALUE`` count as zero.
+
+Sketches are plain JSON-serializable dicts, stored inside stats_state.
+Like csv_utils this module has no Django dependencies.
+"""
+import math
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MAX_BUCKETS = 2048
+MIN_VALUE = 1e-9
+
+
+def _empty_store():
+    return {'offset': 0, 'counts': []}
+
+
+def empty_sketch():
+    """
+    Return the sketch of zero values
+    """
+    return {'count': 0, 'zero': 0, 'pos': _empty_store(), 'neg': _empty_store()}
+
+
+def _collapse(offset, counts):
+    """
+    Fold the lowest buckets into one so at most MAX_BUCKETS remain
+    """
+    excess = len(counts) - MAX_BUCKETS
+    if excess > 0:
+        counts = np.concatenate([[counts[:excess + 1].sum()], counts[excess + 1:]])
+        offset += excess
+    return offset, counts
+
+
+def _store_from_magnitudes(magnitudes):
+    if not len(magnitudes):
+        return _empty_store()
+    keys = np.ceil(np.log(magnitudes) / LOG_GAMMA).astype(np.int64)
+    offset = int(keys.min())
+    offset, counts = _collapse(offset, np.bincount(keys - offset))
+    return {'offset': offset, 'counts': counts.tolist()}
+
+
+def array_sketch(values):
+    """
+    Build the sketch of a float array; NaN marks a missing value
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    magnitudes = np.abs(values)
+    nonzero = magnitudes >= MIN_VALUE
+    return {
+        'count': int(len(values)),
+        'zero': int(len(values) - nonzero.sum()),
+        'pos': _store_from_magnitudes(magnitudes[nonzero & (values > 0)]),
+        'neg': _store_from_magnitudes(magnitudes[nonzero & (values < 0)]),
+    }
+
+
+def _merge_stores(stores):
+    stores = [store for store in stores if store['counts']]
+    if not stores:
+        return _empty_store()
+
+    offset = min(store['offset'] for store in stores)
+    end = max(store['offset'] + len(store['counts']) for store in stores)
+    counts = np.zeros(end - offset, dtype=np.int64)
+    for store in stores:
+        start = store['offset'] - offset
+        counts[start:start + len(store['counts'])] += store['counts']
+    offset, counts = _collapse(offset, counts)
+    return {'offset': offset, 'counts': counts.tolist()}
+
+
+def merge_sketches(sketches):
+    """
+    Combine sketches as if their values were one array
+    """
+    return {
+        'count': sum(sketch['count'] for sketch in sketches),
+        'zero': sum(sketch['zero'] for sketch in sketches),
+        'pos': _merge_stores([sketch['pos'] for sketch in sketches]),
+        'neg': _merge_stores([sketch['neg'] for sketch in sketches]),
+    }
+
+
+def _bucket_value(key):
+    # Midpoint (in relative terms) of the bucket (gamma^(key-1), gamma^key]
+    return 2 * GAMMA ** key / (GAMMA + 1)
+
+
+def sketch_quantiles(sketch, quantiles):
+    """
+    Estimate quantiles (each in [0, 1]) of the values behind a sketch
+
+    Returns one float per quantile, or Nones for an empty sketch.
+    """
+    if not sketch or not sketch['count']:
+        return [None] * len(quantiles)
+
+    # Buckets in ascending value order: negatives by decreasing magnitude,
+    # the zeros, then positives by increasing magnitude
+    neg, pos = sketch['neg'], sketch['pos']
+    neg_keys = np.arange(neg['offset'], neg['offset'] + len(neg['counts']))[::-1]
+    pos_keys = np.arange(pos['offset'], pos['offset'] + len(pos['counts']))
+    values = np.concatenate([
+        -_bucket_value(neg_keys), [0.0], _bucket_value(pos_keys)
+    ])
+    counts = np.concatenate([
+        np.asarray(neg['counts'], dtype=np.int64)[::-1], [sketch['zero']],
+        np.asarray(pos['counts'], dtype=np.int64)
+    ])
+    cumulative = np.cumsum(counts)
+
+    ranks = np.floor(np.asarray(quantiles, dtype=np.float64) * (sketch['count'] - 1))
+    positions = np.searchsorted(cumulative, ranks, side='right')
+    return [float(value) for value in values[positions]]
@@ -0,0 +1,92 @@
+"""
+Renderers for the API
+"""
+import datetime
+import decimal
+import math
+import uuid
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+# Types JSONRenderer's encoder turns into strings, integers or null, which
+# orjson and json.dumps spell the same way
+SAFE_TYPES = (str, int, type(None), datetime.date, datetime.time, datetime.timedelta, uuid.UUID)
+
+
+def _float_matches_json(value):
+    """
+    Whether orjson spells a float the way json.dumps would
+
+    They differ only where either one switches to exponent notation, for
+    magnitudes of 1e16 and up or below 1e-4. NaN and infinities are left
+    to orjson, which renders them as null.
+    """
+    return not value or 1e-4 <= abs(value) < 1e16 or not math.isfinite(value)
+
+
+def _floats_match_json(data):
+    """
+    Whether orjson would spell every float in ``data`` the way json.dumps would
+
+    Only the values are checked, never the text of strings. Containers are
+    walked one level per call and scalars inline, since this runs over
+    every row of a response. Types it does not know are reported as a
+    mismatch, so they go through JSONRenderer.
+    """
+    if isinstance(data, dict):
+        items = data.values()
+    elif isinstance(data, (list, tuple)):
+        items = data
+    elif isinstance(data, float):
+        return _float_matches_json(data)
+    elif isinstance(data, decimal.Decimal):
+        # JSONRenderer's encoder writes decimals as floats
+        return _float_matches_json(float(data))
+    else:
+        return isinstance(data, SAFE_TYPES)
+
+    for item in items:
+        kind = type(item)
+        if kind is str or kind is int or item is None:
+            continue
+        if kind is float:
+            if not _float_matches_json(item):
+                return False
+        elif not _floats_match_json(item):
+            return False
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed
+
+    The output is byte-for-byte what JSONRenderer produces: compact
+    separators, non-ASCII characters unescaped, \\u2028 / \\u2029 escaped
+    and DRF's JSONEncoder for any type orjson does not handle natively.
+    Indented output, non-default UNICODE_JSON / COMPACT_JSON settings,
+    floats orjson would format differently and values orjson cannot
+    encode all fall back to JSONRenderer. One difference remains: NaN and
+    infinities render as null instead of raising.
+    """
+    options = 0 if orjson is None else (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+            or not _floats_match_json(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
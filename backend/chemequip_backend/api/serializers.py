@@ -2,8 +2,11 @@
 Serializers for the API endpoints
 """
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from chemequip_backend.api.models import Dataset, Equipment
+from django.utils import timezone
+from chemequip_backend.api.models import Dataset, Equipment, Job
+from chemequip_backend.api.utils import format_datetime
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -20,26 +23,129 @@ class EquipmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'created_at']
 
 
-class DatasetDetailSerializer(serializers.ModelSerializer):
-    """Detailed serializer for Dataset including equipment"""
-    equipment = EquipmentSerializer(many=True, read_only=True)
+class EquipmentRowSerializer:
+    """
+    Fast read-only serializer for Equipment rows fetched with values_list()
+
+    Produces the same data as EquipmentSerializer without its per-field
+    machinery: rows are tuples in ``fields`` order, zipped into dicts, and
+    only the datetime columns need converting. Ingest stamps a whole batch
+    with one created_at, so formatted datetimes are memoized.
+    """
+    
+    def __init__(self, fields=None):
+        self.fields = tuple(fields or EquipmentSerializer.Meta.fields)
+        self.datetime_columns = [
+            i for i, name in enumerate(self.fields)
+            if Equipment._meta.get_field(name).get_internal_type() == 'DateTimeField'
+        ]
+    
+    def to_representation(self, rows):
+        fields = self.fields
+        if not self.datetime_columns:
+            return [dict(zip(fields, row)) for row in rows]
+        
+        tz = timezone.get_current_timezone()
+        formatted = {}
+        data = []
+        for row in rows:
+            row = list(row)
+            for i in self.datetime_columns:
+                value = row[i]
+                if value not in formatted:
+                    formatted[value] = format_datetime(value, tz)
+                row[i] = formatted[value]
+            data.append(dict(zip(fields, row)))
+        return data
+
+
+def parse_field_list(value):
+    """
+    Split a comma-separated query parameter into field names, or None if absent
+    """
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for ``?fields=`` projection and ``?include=`` embedding
+
+    ``fields`` lists the fields to return (all by default). Relations named
+    in ``Meta.expandable_fields`` are only embedded when listed in
+    ``include`` or ``fields``. Both come from the serializer context, either
+    as ``fields`` / ``include`` keys or from the request's query parameters.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.selected_fields(self.context)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+    
+    @classmethod
+    def get_projection(cls, context):
+        """
+        Return the requested (fields, include) lists; fields is None for all
+        """
+        request = context.get('request')
+        params = request.query_params if request is not None else {}
+        fields = context.get('fields', parse_field_list(params.get('fields')))
+        include = context.get('include', parse_field_list(params.get('include')))
+        return fields, include or []
+    
+    @classmethod
+    def selected_fields(cls, context):
+        """
+        Return the names of the fields this serializer will emit
+        """
+        fields, include = cls.get_projection(context)
+        expandable = getattr(cls.Meta, 'expandable_fields', ())
+        selected = []
+        for name in cls.Meta.fields:
+            if name in include or (fields is not None and name in fields):
+                selected.append(name)
+            elif fields is None and name not in expandable:
+                selected.append(name)
+        return selected
+    
+    @classmethod
+    def project_queryset(cls, queryset, context):
+        """
+        Restrict a queryset to the columns and relations the serializer emits
+        """
+        selected = cls.selected_fields(context)
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        columns = [name for name in selected if name in concrete]
+        if 'user' in selected:
+            queryset = queryset.select_related('user')
+        return queryset.only('id', *columns)
+
+
+class DatasetDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Detailed serializer for Dataset, embedding equipment and user on request"""
+    equipment = serializers.SerializerMethodField()
     user = UserSerializer(read_only=True)
     
     class Meta:
         model = Dataset
         fields = ['id', 'filename', 'uploaded_at', 'summary_stats', 'equipment_count', 'equipment', 'user']
+        expandable_fields = ['equipment', 'user']
+    
+    def get_equipment(self, obj):
+        # Fetch only the emitted columns as tuples, skipping model instances
+        serializer = EquipmentRowSerializer()
+        rows = obj.equipment.order_by('name', 'id').values_list(*serializer.fields)
+        return serializer.to_representation(rows)
 
 
-class DatasetListSerializer(serializers.ModelSerializer):
+class DatasetListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Dataset list view"""
-    equipment_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = Dataset
         fields = ['id', 'filename', 'uploaded_at', 'equipment_count', 'summary_stats']
-    
-    def get_equipment_count(self, obj):
-        return obj.equipment.count()
 
 
 class CSVUploadSerializer(serializers.Serializer):
@@ -49,6 +155,27 @@ class CSVUploadSerializer(serializers.Serializer):
     def validate_file(self, file):
         if not file.name.endswith('.csv'):
             raise serializers.ValidationError("File must be a CSV file.")
+        max_size = getattr(settings, 'CSV_UPLOAD_MAX_SIZE', None)
+        if max_size and file.size > max_size:
+            raise serializers.ValidationError(f"File must not exceed {max_size} bytes.")
+        return file
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for background job status"""
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'state', 'filename', 'dataset', 'options', 'rows_processed', 'progress',
+                  'error', 'attempts', 'created_at', 'started_at', 'finished_at']
+
+
+class ZIPUploadSerializer(serializers.Serializer):
+    """Serializer for ZIP archive of CSV files upload"""
+    file = serializers.FileField()
+    
+    def validate_file(self, file):
+        if not file.name.lower().endswith('.zip'):
+            raise serializers.ValidationError("File must be a ZIP archive.")
         return file
 
 
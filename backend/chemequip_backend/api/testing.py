@@ -0,0 +1,24 @@
+"""
+Test helpers for the API
+"""
+from contextlib import contextmanager
+from chemequip_backend.api.middleware import QueryRecorder
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin asserting a block stays within a fixed query budget
+
+    Unlike assertNumQueries it checks an upper bound, so the same budget
+    can be asserted at several data sizes to catch N+1 patterns.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using='default'):
+        with QueryRecorder(using) as recorder:
+            yield recorder
+        if recorder.count > budget:
+            self.fail(
+                f"{recorder.count} queries executed, budget is {budget}:\n"
+                + '\n'.join(f'{i}. {sql}' for i, sql in enumerate(recorder.queries, 1))
+            )
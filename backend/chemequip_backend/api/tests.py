@@ -3,9 +3,11 @@ Tests for API endpoints
 """
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from rest_framework import status
-from chemequip_backend.api.models import Dataset, Equipment
+from chemequip_backend.api.models import Dataset, Equipment, Job
+from chemequip_backend.api.testing import QueryBudgetMixin
 import io
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -34,7 +36,7 @@ class UserAuthTestCase(TestCase):
             email='test@example.com',
             password='testpass123'
         )
-        
+
         response = self.client.post('/api/users/login/', {
             'username': 'testuser',
             'password': 'testpass123'
@@ -63,44 +65,565 @@ class DatasetUploadTestCase(TestCase):
         from rest_framework.authtoken.models import Token
         self.token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        cache.clear()
     
     def test_csv_upload(self):
         """Test CSV file upload"""
         csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
 Pump-01,Pump,150.5,10.5,45.2
 Heat Exchanger-01,Heat Exchanger,500.0,6.0,65.5"""
-        
+
         file = SimpleUploadedFile(
             "test.csv",
             csv_content,
             content_type="text/csv"
         )
-        
+
         response = self.client.post('/api/datasets/upload_csv/', {
             'file': file
         }, format='multipart')
-        
+
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertIn('dataset', response.data)
         self.assertEqual(response.data['dataset']['equipment_count'], 2)
+        self.assertNotIn('equipment', response.data['dataset'])
     
     def test_invalid_csv_format(self):
         """Test upload with invalid CSV format"""
         csv_content = b"""Invalid,Format
 Data,Here"""
-        
+
         file = SimpleUploadedFile(
             "test.csv",
             csv_content,
             content_type="text/csv"
         )
-        
+
+        response = self.client.post('/api/datasets/upload_csv/', {
+            'file': file
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_csv_upload_in_batches(self):
+        """Test rows are all inserted when they span several batches"""
+        rows = '\n'.join(f"Pump-{i:02d},Pump,{100 + i},10.0," for i in range(25))
+        csv_content = f"Equipment Name,Type,Flowrate,Pressure,Temperature\n{rows}".encode()
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
+        with self.settings(CSV_INGEST_BATCH_SIZE=10):
+            response = self.client.post('/api/datasets/upload_csv/', {
+                'file': file
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        dataset = Dataset.objects.get(id=response.data['dataset']['id'])
+        self.assertEqual(dataset.equipment.count(), 25)
+        self.assertEqual(dataset.equipment_count, 25)
+        self.assertIsNone(dataset.equipment.first().temperature)
+    
+    def test_summary_stats_computed_at_ingest(self):
+        """Test summary statistics are stored from the uploaded rows"""
+        csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,100,10,
+Pump-02,Pump,200,20,50
+Reactor-01,Reactor,300,,70"""
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
+        with self.settings(CSV_INGEST_BATCH_SIZE=2):
+            response = self.client.post('/api/datasets/upload_csv/', {
+                'file': file
+            }, format='multipart')
+
+        stats = response.data['dataset']['summary_stats']
+        self.assertEqual(stats['total_equipment'], 3)
+        self.assertEqual(stats['avg_flowrate'], 200.0)
+        self.assertEqual(stats['std_flowrate'], 100.0)
+        self.assertEqual(stats['min_pressure'], 10.0)
+        self.assertEqual(stats['max_temperature'], 70.0)
+        self.assertEqual(stats['null_counts'], {'flowrate': 0, 'pressure': 1, 'temperature': 1})
+        self.assertEqual(stats['equipment_type_distribution'], {'Pump': 2, 'Reactor': 1})
+    
+    def test_columnar_sidecar_written_at_ingest(self):
+        """Test ingest writes memory-mappable columns next to the stored file"""
+        from chemequip_backend.api.columnar import load_dataset_columns
+
+        csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,100,10,
+Reactor-01,Reactor,200,20,50
+Pump-02,Pump,300,,70"""
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
+        with self.settings(CSV_INGEST_BATCH_SIZE=2):
+            response = self.client.post('/api/datasets/upload_csv/', {
+                'file': file
+            }, format='multipart')
+
+        dataset = Dataset.objects.get(id=response.data['dataset']['id'])
+        columns = load_dataset_columns(dataset)
+        self.assertEqual(columns['rows'], 3)
+        self.assertEqual(columns['flowrate'].tolist(), [100.0, 200.0, 300.0])
+        self.assertEqual(columns['temperature'][1:].tolist(), [50.0, 70.0])
+        self.assertEqual([columns['types'][code] for code in columns['equipment_type']], ['Pump', 'Reactor', 'Pump'])
+
+        response = self.client.get(f'/api/datasets/{dataset.id}/summary/')
+        self.assertEqual(response.data['averages'], {'flowrate': 200.0, 'pressure': 15.0, 'temperature': 60.0})
+        self.assertEqual(response.data['type_distribution'], {'Pump': 2, 'Reactor': 1})
+    
+    def test_user_summary_merges_dataset_states(self):
+        """Test the user summary merges per-dataset stats and drops deleted ones"""
+        first = SimpleUploadedFile("a.csv", b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,100,10,40
+Pump-02,Pump,200,20,60""", content_type="text/csv")
+        second = SimpleUploadedFile("b.csv", b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Reactor-01,Reactor,600,,80""", content_type="text/csv")
+
+        self.client.post('/api/datasets/upload_csv/', {'file': first}, format='multipart')
+        response = self.client.post('/api/datasets/upload_csv/', {'file': second}, format='multipart')
+        second_id = response.data['dataset']['id']
+
+        summary = self.client.get('/api/summary/summary/').data
+        self.assertEqual(summary['total_equipment'], 3)
+        self.assertEqual(summary['avg_flowrate'], 300.0)
+        self.assertEqual(summary['avg_pressure'], 15.0)
+        self.assertEqual(summary['equipment_type_distribution'], {'Pump': 2, 'Reactor': 1})
+
+        self.client.delete(f'/api/datasets/{second_id}/')
+
+        summary = self.client.get('/api/summary/summary/').data
+        self.assertEqual(summary['total_equipment'], 2)
+        self.assertEqual(summary['avg_flowrate'], 150.0)
+        self.assertEqual(summary['equipment_type_distribution'], {'Pump': 2})
+    
+    def test_quantile_sketches_merged_across_datasets(self):
+        """Test medians and p95s come from merged sketches within the error bound"""
+        import numpy as np
+        from django.core.management import call_command
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from chemequip_backend.api.csv_utils import has_sketches
+
+        rng = np.random.default_rng(7)
+        parts = [rng.lognormal(2, 1, 400), rng.normal(-5, 20, 300)]
+        for i, pressures in enumerate(parts):
+            rows = '\n'.join(f"Unit-{j},Pump,1,{float(p)!r},{j}" for j, p in enumerate(pressures))
+            file = SimpleUploadedFile(f"{i}.csv", f"Equipment Name,Type,Flowrate,Pressure,Temperature\n{rows}".encode(), content_type="text/csv")
+            self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart')
+
+        pressures = np.sort(np.concatenate(parts))
+        exact = {q: pressures[int(q * (len(pressures) - 1))] for q in (0.5, 0.95)}
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = self.client.get('/api/summary/summary/').data
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "api_equipment"' in q['sql']])
+        # 1% relative error, plus the summary's rounding to 2 decimals
+        self.assertAlmostEqual(summary['median_pressure'], exact[0.5], delta=abs(exact[0.5]) * 0.01 + 0.005)
+        self.assertAlmostEqual(summary['p95_pressure'], exact[0.95], delta=abs(exact[0.95]) * 0.01 + 0.005)
+
+        # States stored before sketches existed are completed by the backfill
+        dataset = Dataset.objects.filter(user=self.user).first()
+        for field in ('flowrate', 'pressure', 'temperature'):
+            del dataset.stats_state[field]['sketch']
+        dataset.save()
+        call_command('backfill_stats_states', stdout=io.StringIO())
+        dataset.refresh_from_db()
+        self.assertTrue(has_sketches(dataset.stats_state))
+        self.assertEqual(self.client.get('/api/summary/summary/').data['p95_pressure'], summary['p95_pressure'])
+    
+    def test_invalid_row_leaves_no_partial_dataset(self):
+        """Test a bad value rolls back the whole upload"""
+        csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,150.5,10.5,45.2
+Pump-02,Pump,fast,10.5,45.2"""
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
         response = self.client.post('/api/datasets/upload_csv/', {
             'file': file
         }, format='multipart')
-        
+
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('row 2', response.data['error'])
+        self.assertFalse(Dataset.objects.exists())
+        self.assertFalse(Equipment.objects.exists())
+    
+    def test_non_utf8_csv_rejected_while_streaming(self):
+        """Test the upload handler rejects undecodable files before ingest"""
+        csv_content = "Equipment Name,Type,Flowrate,Pressure,Temperature\nPümp-01,Pump,1,2,3".encode('latin-1')
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
+        response = self.client.post('/api/datasets/upload_csv/', {
+            'file': file
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "CSV file must be UTF-8 encoded")
+        self.assertFalse(Dataset.objects.exists())
+
+    def test_upload_chunk_size_setting(self):
+        """Test CSV_UPLOAD_CHUNK_SIZE is read per upload, even for tiny chunks"""
+        from chemequip_backend.api.upload_handlers import StreamingCSVUploadHandler
+
+        csv_content = "Equipment Name,Type,Flowrate,Pressure,Temperature\nPümp-01,Pump,1,2,3".encode()
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
+        with self.settings(CSV_UPLOAD_CHUNK_SIZE=7):
+            self.assertEqual(StreamingCSVUploadHandler().chunk_size, 7)
+            response = self.client.post('/api/datasets/upload_csv/', {
+                'file': file
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Equipment.objects.get().name, 'Pümp-01')
+    
+    def test_dataset_download_ranges_and_conditionals(self):
+        """Test the original file download supports Range and ETag requests"""
+        csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,150.5,10.5,45.2"""
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+        response = self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart')
+        url = f"/api/datasets/{response.data['dataset']['id']}/download/"
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), csv_content)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-13')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'Equipment Name')
+        self.assertEqual(response['Content-Range'], f'bytes 0-13/{len(csv_content)}')
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(csv_content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.settings(DATASET_SENDFILE='x-accel-redirect'):
+            response = self.client.get(url)
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/protected-media/datasets/'))
+    
+    def test_pdf_report_cached_on_disk(self):
+        """Test PDF reports are generated once, revalidated, evicted and cleaned up"""
+        import os
+        import tempfile
+        from unittest import mock
+
+        def upload(name):
+            file = SimpleUploadedFile(name, b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,150.5,10.5,45.2""", content_type="text/csv")
+            return self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart').data['dataset']['id']
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            reports = os.path.join(media_root, 'reports')
+            first = upload('first.csv')
+            
+            response = self.client.get(f'/api/datasets/{first}/generate_pdf/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+            etag = response['ETag']
+            self.assertEqual(len(os.listdir(reports)), 1)
+            
+            with mock.patch('chemequip_backend.api.pdf_utils.generate_pdf_report') as generate:
+                response = self.client.get(f'/api/datasets/{first}/generate_pdf/')
+                self.assertEqual(response['ETag'], etag)
+                response = self.client.get(f'/api/datasets/{first}/generate_pdf/', HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            generate.assert_not_called()
+            
+            # A cache smaller than one report keeps only the newest
+            second = upload('second.csv')
+            with self.settings(PDF_CACHE_MAX_SIZE=1):
+                self.client.get(f'/api/datasets/{second}/generate_pdf/')
+            self.assertEqual([name.split('-')[0] for name in os.listdir(reports)], [str(second)])
+            
+            self.client.delete(f'/api/datasets/{second}/')
+            self.assertEqual(os.listdir(reports), [])
+    
+    def test_pdf_report_details_chunked_and_capped(self):
+        """Test the details section is paged in chunks, capped and optional"""
+        import tempfile
+        from PyPDF2 import PdfReader
+        from chemequip_backend.api.pdf_utils import generate_pdf_report
+
+        dataset = Dataset.objects.create(user=self.user, filename='big.csv', equipment_count=100)
+        Equipment.objects.bulk_create([
+            Equipment(dataset=dataset, name=f'Pump-{i:03d}', equipment_type='Pump', flowrate=float(i))
+            for i in range(100)
+        ])
+
+        def pages(**kwargs):
+            output = io.BytesIO()
+            generate_pdf_report(dataset, output, **kwargs)
+            return len(PdfReader(output).pages)
+
+        with self.settings(PDF_TABLE_CHUNK_ROWS=25, PDF_MAX_DETAIL_ROWS=None):
+            full = pages()
+            summary_only = pages(summary_only=True)
+            with self.settings(PDF_MAX_DETAIL_ROWS=25):
+                capped = pages()
+
+        # 100 rows span 4-5 pages, 25 rows 1-2
+        self.assertIn(full - summary_only, (4, 5))
+        self.assertIn(capped - summary_only, (1, 2))
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            response = self.client.get(f'/api/datasets/{dataset.id}/generate_pdf/', {'mode': 'summary'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            content = b''.join(response.streaming_content)
+        self.assertEqual(len(PdfReader(io.BytesIO(content)).pages), summary_only)
+    
+    def test_async_csv_upload(self):
+        """Test queued uploads are processed by the job worker"""
+        from django.core.management import call_command
+
+        csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,150.5,10.5,45.2
+Heat Exchanger-01,Heat Exchanger,500.0,6.0,65.5"""
+
+        file = SimpleUploadedFile("test.csv", csv_content, content_type="text/csv")
+
+        response = self.client.post('/api/datasets/upload_csv/?async=1', {
+            'file': file
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data['job']['id']
+        self.assertEqual(response.data['job']['state'], 'queued')
+        self.assertFalse(Dataset.objects.exists())
+
+        call_command('process_jobs', workers=1, once=True, stdout=io.StringIO())
+
+        response = self.client.get(f'/api/jobs/{job_id}/')
+        self.assertEqual(response.data['state'], 'succeeded')
+        self.assertEqual(response.data['rows_processed'], 2)
+        dataset = Dataset.objects.get(id=response.data['dataset'])
+        self.assertEqual(dataset.equipment.count(), 2)
+
+    def test_stale_running_jobs_requeued_then_failed(self):
+        """Test jobs left running by a dead worker are retried, then failed"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from chemequip_backend.api.jobs import claim_next_job, run_job
+
+        dataset = Dataset.objects.create(user=self.user, filename='unit.csv')
+        job = Job.objects.create(user=self.user, kind=Job.KIND_PDF_REPORT, dataset=dataset)
+
+        def abandon():
+            # A worker claims the job, then dies before finishing it
+            claimed = claim_next_job()
+            self.assertEqual(claimed.id, job.id)
+            Job.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(seconds=120))
+            return claimed
+
+        with self.settings(JOB_TIMEOUT=60, JOB_MAX_ATTEMPTS=2):
+            first = abandon()
+            # Not yet timed out: nothing to claim
+            with self.settings(JOB_TIMEOUT=600):
+                self.assertIsNone(claim_next_job())
+
+            second = abandon()
+            self.assertEqual(second.attempts, 2)
+            # The first worker finishing late no longer overwrites the job
+            first.dataset = None
+            run_job(first)
+            self.assertEqual(first.state, Job.STATE_RUNNING)
+
+            self.assertIsNone(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.STATE_FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('did not finish', job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_async_pdf_report(self):
+        """Test queued PDF reports record progress and download when ready"""
+        import tempfile
+        from django.core.management import call_command
+
+        dataset = Dataset.objects.create(user=self.user, filename='big.csv', equipment_count=60)
+        Equipment.objects.bulk_create([
+            Equipment(dataset=dataset, name=f'Pump-{i:03d}', equipment_type='Pump', flowrate=float(i))
+            for i in range(60)
+        ])
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            response = self.client.get(f'/api/datasets/{dataset.id}/generate_pdf/', {'async': '1'})
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            job_id = response.data['job']['id']
+            self.assertEqual(response.data['job']['kind'], 'pdf_report')
+            
+            response = self.client.get(f'/api/jobs/{job_id}/download/')
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            
+            call_command('process_jobs', workers=1, once=True, stdout=io.StringIO())
+            
+            response = self.client.get(f'/api/jobs/{job_id}/')
+            self.assertEqual(response.data['state'], 'succeeded')
+            progress = response.data['progress']
+            self.assertEqual(progress['sections_done'], progress['sections_total'])
+            self.assertEqual(progress['section'], 'details')
+            self.assertGreaterEqual(progress['pages'], 4)
+            
+            response = self.client.get(f'/api/jobs/{job_id}/download/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+    
+    def test_zip_upload(self):
+        """Test a ZIP of CSV files creates one dataset per valid member"""
+        import zipfile
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('unit-a.csv', "Equipment Name,Type,Flowrate,Pressure,Temperature\nPump-01,Pump,1,2,3")
+            zf.writestr('shift/unit-b.csv', "Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+                                            "Pump-01,Pump,1,2,3\nReactor-01,Reactor,4,5,6")
+            zf.writestr('broken.csv', "Invalid,Format\nData,Here")
+            zf.writestr('unit-a-copy.csv', "Equipment Name,Type,Flowrate,Pressure,Temperature\nPump-01,Pump,1,2,3")
+
+        file = SimpleUploadedFile("batch.zip", archive.getvalue(), content_type="application/zip")
+
+        # Archive uploads run a few queries per member, beyond QUERY_BUDGET
+        with self.settings(CSV_ARCHIVE_WORKERS=2, QUERY_BUDGET=None):
+            response = self.client.post('/api/datasets/upload_zip/', {
+                'file': file
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = {result['filename']: result for result in response.data['results']}
+        self.assertEqual(results['unit-a.csv']['equipment_count'], 1)
+        self.assertEqual(results['unit-b.csv']['equipment_count'], 2)
+        self.assertEqual(results['broken.csv']['status'], 'error')
+        self.assertFalse(results['unit-a.csv']['deduplicated'])
+        self.assertTrue(results['unit-a-copy.csv']['deduplicated'])
+        self.assertEqual(results['unit-a-copy.csv']['equipment_count'], 1)
+        self.assertEqual(Dataset.objects.filter(user=self.user).count(), 3)
+        dataset = Dataset.objects.get(id=results['unit-b.csv']['dataset_id'])
+        self.assertEqual(dataset.summary_stats['equipment_type_distribution'], {'Pump': 1, 'Reactor': 1})
+    
+    def test_duplicate_upload_reuses_dataset(self):
+        """Test re-uploading the same CSV clones the dataset without parsing it"""
+        import tempfile
+        from unittest import mock
+        csv_content = b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,150.5,10.5,45.2
+Reactor-01,Reactor,300,,70"""
+
+        def upload(name):
+            file = SimpleUploadedFile(name, csv_content, content_type="text/csv")
+            return self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart')
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            first = upload('first.csv')
+            self.assertFalse(first.data['deduplicated'])
+            
+            with mock.patch('chemequip_backend.api.utils.read_csv_batches') as read:
+                second = upload('second.csv')
+            read.assert_not_called()
+            self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+            self.assertTrue(second.data['deduplicated'])
+            self.assertEqual(second.data['dataset']['filename'], 'second.csv')
+            self.assertEqual(second.data['dataset']['summary_stats'], first.data['dataset']['summary_stats'])
+            
+            original = Dataset.objects.get(id=first.data['dataset']['id'])
+            copy = Dataset.objects.get(id=second.data['dataset']['id'])
+            self.assertEqual(copy.file.name, original.file.name)
+            self.assertEqual(
+                list(copy.equipment.values_list('name', 'equipment_type', 'flowrate', 'pressure', 'temperature')),
+                list(original.equipment.values_list('name', 'equipment_type', 'flowrate', 'pressure', 'temperature'))
+            )
+            
+            # The shared file outlives the first dataset
+            self.client.delete(f'/api/datasets/{original.id}/')
+            self.assertTrue(copy.file.storage.exists(copy.file.name))
+            response = self.client.get(f'/api/datasets/{copy.id}/download/')
+            self.assertEqual(b''.join(response.streaming_content), csv_content)
     
+    def test_retention_and_garbage_collection(self):
+        """Test retention deletes old rows in bulk and collect_garbage their files"""
+        import os
+        import tempfile
+        from django.core.management import call_command
+
+        def upload(name, rows):
+            lines = '\n'.join(f"{name}-{i},Pump,{i},1,2" for i in range(rows))
+            file = SimpleUploadedFile(f"{name}.csv", f"Equipment Name,Type,Flowrate,Pressure,Temperature\n{lines}".encode(), content_type="text/csv")
+            response = self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart')
+            return Dataset.objects.get(id=response.data['dataset']['id'])
+
+        def collect():
+            call_command('collect_garbage', min_age=0, stdout=io.StringIO())
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root, DATASET_RETENTION_COUNT=2):
+            first = upload('a', 30)
+            self.client.get(f'/api/datasets/{first.id}/generate_pdf/')
+            job = Job.objects.create(user=self.user, kind=Job.KIND_PDF_REPORT, dataset=first)
+            copy = Dataset.objects.get(id=self.client.post('/api/datasets/upload_csv/', {
+                'file': SimpleUploadedFile("a-copy.csv", first.file.read(), content_type="text/csv")
+            }, format='multipart').data['dataset']['id'])
+            first.file.close()
+            
+            second = upload('b', 5)
+            self.assertFalse(Dataset.objects.filter(id=first.id).exists())
+            self.assertFalse(Equipment.objects.filter(dataset_id=first.id).exists())
+            job.refresh_from_db()
+            self.assertIsNone(job.dataset)
+            
+            # The file is shared with the copy; only the stale report goes
+            collect()
+            self.assertTrue(os.path.exists(copy.file.path))
+            self.assertTrue(os.path.exists(copy.file.path + '.columns'))
+            self.assertEqual(os.listdir(os.path.join(media_root, 'reports')), [])
+            
+            upload('c', 5)
+            self.assertTrue(os.path.exists(copy.file.path))
+            collect()
+            self.assertFalse(os.path.exists(copy.file.path))
+            self.assertFalse(os.path.exists(copy.file.path + '.columns'))
+            self.assertTrue(os.path.exists(second.file.path + '.columns'))
+            self.assertEqual(
+                self.client.get(f'/api/datasets/{second.id}/download/').status_code, status.HTTP_200_OK
+            )
+
+    def test_garbage_collection_of_async_uploads(self):
+        """Test files of queued uploads are collected once their dataset is gone"""
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from chemequip_backend.api.utils import collect_orphaned_files
+
+        def upload(name, query=''):
+            file = SimpleUploadedFile(f"{name}.csv", f"""Equipment Name,Type,Flowrate,Pressure,Temperature
+{name},Pump,1,2,3""".encode(), content_type="text/csv")
+            return self.client.post(f'/api/datasets/upload_csv/{query}', {'file': file}, format='multipart')
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root, DATASET_RETENTION_COUNT=1):
+            job = Job.objects.get(id=upload('a', '?async=1').data['job']['id'])
+            path = job.file.path
+            queued = collect_orphaned_files(min_age=-1)
+            self.assertEqual(queued['files'], 0)
+
+            call_command('process_jobs', workers=1, once=True, stdout=io.StringIO())
+            job.refresh_from_db()
+            self.assertEqual(job.state, Job.STATE_SUCCEEDED)
+            self.assertFalse(job.file)
+            self.assertEqual(job.dataset.file.path, path)
+            self.assertTrue(os.path.exists(path + '.columns'))
+
+            upload('b')
+            self.assertFalse(Dataset.objects.filter(id=job.dataset_id).exists())
+            collected = collect_orphaned_files(min_age=-1)
+            self.assertEqual((collected['files'], collected['sidecars']), (1, 1))
+            self.assertFalse(os.path.exists(path))
+            self.assertFalse(os.path.exists(path + '.columns'))
+
     def test_non_csv_file(self):
         """Test upload with non-CSV file"""
         file = SimpleUploadedFile(
@@ -108,11 +631,11 @@ Data,Here"""
             b"This is not a CSV",
             content_type="text/plain"
         )
-        
+
         response = self.client.post('/api/datasets/upload_csv/', {
             'file': file
         }, format='multipart')
-        
+
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
@@ -128,7 +651,8 @@ class DatasetManagementTestCase(TestCase):
         from rest_framework.authtoken.models import Token
         self.token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
-        
+        cache.clear()
+
         # Create test dataset
         self.dataset = Dataset.objects.create(
             user=self.user,
@@ -147,3 +671,488 @@ class DatasetManagementTestCase(TestCase):
         response = self.client.get(f'/api/datasets/{self.dataset.id}/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['filename'], 'test.csv')
+    
+    def test_dataset_detail_sparse_fields(self):
+        """Test ?fields= projection and ?include= embedding on dataset details"""
+        Equipment.objects.create(dataset=self.dataset, name='Pump-02', equipment_type='Pump', flowrate=1.0)
+        Equipment.objects.create(dataset=self.dataset, name='Pump-01', equipment_type='Pump', flowrate=2.0)
+        url = f'/api/datasets/{self.dataset.id}/'
+
+        response = self.client.get(url)
+        self.assertNotIn('equipment', response.data)
+        self.assertNotIn('user', response.data)
+
+        response = self.client.get(url, {'include': 'equipment,user'})
+        self.assertEqual([row['name'] for row in response.data['equipment']], ['Pump-01', 'Pump-02'])
+        self.assertEqual(set(response.data['equipment'][0]), {'id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'created_at'})
+        self.assertEqual(response.data['user']['username'], 'testuser')
+
+        response = self.client.get(url, {'fields': 'id,filename'})
+        self.assertEqual(set(response.data), {'id', 'filename'})
+
+        response = self.client.get('/api/datasets/', {'fields': 'id,equipment_count'})
+        self.assertEqual(response.data['results'], [{'id': self.dataset.id, 'equipment_count': 2}])
+    
+    def test_dataset_summary_aggregates_in_database(self):
+        """Test the per-dataset summary is computed with a fixed number of queries"""
+        Equipment.objects.bulk_create([
+            Equipment(dataset=self.dataset, name=f'Pump-{i}', equipment_type='Pump',
+                      flowrate=100.0 + i, pressure=None, temperature=50.0)
+            for i in range(20)
+        ] + [
+            Equipment(dataset=self.dataset, name='Reactor-1', equipment_type='Reactor',
+                      flowrate=None, pressure=5.0, temperature=70.0)
+        ])
+
+        # No stored state: two aggregation queries and one column scan for
+        # the quantile sketches, saving the state, plus authentication, the
+        # data version and the dataset lookup
+        with self.assertNumQueries(7):
+            response = self.client.get(f'/api/datasets/{self.dataset.id}/summary/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 21)
+        self.assertEqual(response.data['averages']['flowrate'], 109.5)
+        self.assertAlmostEqual(response.data['medians']['flowrate'], 109.0, delta=1.09)
+        self.assertEqual(response.data['averages']['pressure'], 5.0)
+        self.assertEqual(response.data['type_distribution'], {'Pump': 20, 'Reactor': 1})
+
+        # The saved state is used from then on, without rescanning rows
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(f'/api/datasets/{self.dataset.id}/summary/').data, response.data)
+    
+    def test_summary_responses_cached_with_etags(self):
+        """Test summaries are served from the cache, revalidated and invalidated"""
+        Equipment.objects.create(dataset=self.dataset, name='Pump-01', equipment_type='Pump', flowrate=100.0)
+        Equipment.objects.create(dataset=self.dataset, name='Pump-02', equipment_type='Pump', flowrate=200.0)
+
+        for url in [f'/api/datasets/{self.dataset.id}/summary/', '/api/summary/summary/']:
+            first = self.client.get(url)
+            etag = first['ETag']
+            
+            # Only the token lookup and the data version touch the database
+            with self.assertNumQueries(2):
+                self.assertEqual(self.client.get(url).data, first.data)
+            with self.assertNumQueries(2):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        file = SimpleUploadedFile("new.csv", b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Reactor-01,Reactor,600,5,80""", content_type="text/csv")
+        self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart')
+
+        response = self.client.get('/api/summary/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_equipment'], 3)
+
+        self.client.delete(f'/api/datasets/{self.dataset.id}/')
+        response = self.client.get(f'/api/datasets/{self.dataset.id}/summary/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_out_of_range_ids_not_found(self):
+        """Test detail URLs with ids the database cannot hold return 404"""
+        for pk in ('99999999999999999999', '0', 'abc'):
+            for url in [
+                f'/api/datasets/{pk}/', f'/api/datasets/{pk}/summary/',
+                f'/api/datasets/{pk}/histogram/?param=flowrate', f'/api/datasets/{pk}/chart_data/',
+                f'/api/datasets/{pk}/equipment/', f'/api/datasets/{pk}/generate_pdf/',
+                f'/api/equipment/{pk}/', f'/api/jobs/{pk}/',
+            ]:
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get('/api/datasets/99999999999999999999/summary/')
+        self.assertEqual(response.data, {'error': 'Dataset not found'})
+    
+    def test_cache_invalidated_by_other_processes(self):
+        """Test a data change made with a different cache still invalidates cached summaries"""
+        from unittest import mock
+        from django.core.cache.backends.locmem import LocMemCache
+        from django.core.management import call_command
+
+        Equipment.objects.create(dataset=self.dataset, name='Pump-01', equipment_type='Pump', flowrate=100.0)
+        first = self.client.get('/api/summary/summary/')
+
+        file = SimpleUploadedFile("new.csv", b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Reactor-01,Reactor,600,5,80""", content_type="text/csv")
+        response = self.client.post('/api/datasets/upload_csv/?async=1', {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        # The worker process has a cache of its own
+        with mock.patch('chemequip_backend.api.cache_utils.cache', LocMemCache('worker', {})):
+            call_command('process_jobs', workers=1, once=True, stdout=io.StringIO())
+
+        response = self.client.get('/api/summary/summary/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.data['total_equipment'], first.data['total_equipment'] + 1)
+    
+    def test_histogram_endpoints(self):
+        """Test histogram bins and percentiles from the sidecar, the database and across datasets"""
+        import tempfile
+        import numpy as np
+        from chemequip_backend.api.columnar import delete_dataset_columns
+
+        Equipment.objects.bulk_create([
+            Equipment(dataset=self.dataset, name=f'Pump-{i}', equipment_type='Pump', flowrate=float(i))
+            for i in range(1, 101)
+        ] + [Equipment(dataset=self.dataset, name='Pump-x', equipment_type='Pump')])
+
+        response = self.client.get(f'/api/datasets/{self.dataset.id}/histogram/?param=flowrate&bins=10')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 100)
+        self.assertEqual(response.data['counts'], [10] * 10)
+        self.assertEqual(response.data['bin_edges'][0], 1.0)
+        self.assertEqual(response.data['bin_edges'][-1], 100.0)
+        self.assertEqual(response.data['percentiles']['p50'], 50.5)
+        self.assertEqual(response.data['percentiles']['p95'], float(np.percentile(np.arange(1, 101), 95)))
+        self.assertIn('ETag', response)
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            rows = '\n'.join(f"Unit-{i},Pump,{i * 1.5},{i % 7},{20 + i}" for i in range(300))
+            file = SimpleUploadedFile("big.csv", f"Equipment Name,Type,Flowrate,Pressure,Temperature\n{rows}".encode(), content_type="text/csv")
+            uploaded = self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart').data['dataset']['id']
+            
+            from_sidecar = self.client.get(f'/api/datasets/{uploaded}/histogram/?param=temperature&bins=20').data
+            delete_dataset_columns(Dataset.objects.get(id=uploaded))
+            from_database = self.client.get(f'/api/datasets/{uploaded}/histogram/?param=temperature&bins=20').data
+            self.assertEqual(from_sidecar, from_database)
+            
+            combined = self.client.get('/api/summary/histogram/?param=flowrate&bins=5').data
+            self.assertEqual(combined['count'], 400)
+            self.assertEqual(sum(combined['counts']), 400)
+
+        for query in ('param=size', 'param=flowrate&bins=0', 'param=flowrate&bins=x'):
+            response = self.client.get(f'/api/datasets/{self.dataset.id}/histogram/?{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/datasets/9999/histogram/?param=flowrate')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_chart_data_sample_and_density(self):
+        """Test chart data is bounded, stratified by type and binned"""
+        types = ['Pump'] * 90 + ['Reactor'] * 9 + ['Column']
+        Equipment.objects.bulk_create([
+            Equipment(dataset=self.dataset, name=f'Unit-{i}', equipment_type=kind,
+                      flowrate=float(i), pressure=float(i % 10), temperature=None if i == 0 else 50.0)
+            for i, kind in enumerate(types)
+        ])
+        url = f'/api/datasets/{self.dataset.id}/chart_data/'
+
+        response = self.client.get(f'{url}?params=flowrate,pressure,temperature&points=20')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 99)
+        self.assertLessEqual(response.data['returned'], 20)
+        series = response.data['series']
+        self.assertEqual(set(series), {'Pump', 'Reactor', 'Column'})
+        self.assertEqual(len(series['Column']['flowrate']), 1)
+        self.assertGreater(len(series['Pump']['flowrate']), len(series['Reactor']['flowrate']))
+        self.assertEqual(self.client.get(f'{url}?params=flowrate,pressure,temperature&points=20').data, response.data)
+        self.assertLessEqual(self.client.get(f'{url}?points=2').data['returned'], 2)
+
+        response = self.client.get(f'{url}?mode=density&params=flowrate,pressure&resolution=10')
+        self.assertEqual(len(response.data['counts']), 10)
+        self.assertEqual(sum(map(sum, response.data['counts'])), 100)
+        self.assertEqual(response.data['x_edges'][0], 0.0)
+        self.assertEqual(len(response.data['y_edges']), 11)
+
+        for query in ('params=flowrate', 'params=flowrate,size', 'mode=grid', 'points=0',
+                      'mode=density&params=flowrate,pressure,temperature', 'mode=density&resolution=1000'):
+            response = self.client.get(f'{url}?{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+    
+    def test_compare_datasets(self):
+        """Test comparing two datasets joins on normalized names"""
+        def upload(name, content):
+            file = SimpleUploadedFile(name, content, content_type="text/csv")
+            return self.client.post('/api/datasets/upload_csv/', {'file': file}, format='multipart').data['dataset']['id']
+
+        base = upload('shift-1.csv', b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump-01,Pump,100,10,40
+Pump-02,Pump,200,20,
+Valve-01,Other,5,1,20
+Reactor-01,Reactor,600,5,80""")
+        target = upload('shift-2.csv', b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+pump-01 ,Pump,100,10,40
+PUMP-02,Pump,250,20,
+Reactor-01,Reactor,600,5.5,80
+Column-01,Column,50,2,30""")
+
+        response = self.client.get('/api/datasets/compare/', {'base': base, 'target': target})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['counts'], {'added': 1, 'removed': 1, 'changed': 2, 'unchanged': 1})
+        self.assertEqual([row['name'] for row in data['added']], ['Column-01'])
+        self.assertEqual(data['removed'][0]['name'], 'Valve-01')
+
+        changes = {change['name']: change for change in data['changed']}
+        self.assertEqual(changes['PUMP-02']['flowrate'], {'base': 200.0, 'target': 250.0, 'delta': 50.0})
+        self.assertEqual(changes['PUMP-02']['temperature'], {'base': None, 'target': None, 'delta': None})
+        self.assertEqual(changes['Reactor-01']['pressure']['delta'], 0.5)
+
+        self.assertEqual(data['drift']['total_equipment'], {'base': 4, 'target': 4, 'delta': 0})
+        self.assertEqual(data['drift']['max_flowrate']['delta'], 0.0)
+        self.assertEqual(data['drift']['equipment_type_distribution']['Column'], {'base': 0, 'target': 1, 'delta': 1})
+
+        response = self.client.get('/api/datasets/compare/', {'base': base, 'target': target, 'limit': 1})
+        self.assertEqual(len(response.data['changed']), 1)
+        self.assertEqual(response.data['counts']['changed'], 2)
+
+        # Repeated names pair up in row order and never collide with similar names
+        repeats = upload('repeats-1.csv', b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+Pump 1,Pump,1,1,1
+Pump 1,Pump,2,1,1""")
+        response = self.client.get('/api/datasets/compare/', {'base': repeats, 'target': upload('repeats-2.csv', b"""Equipment Name,Type,Flowrate,Pressure,Temperature
+pump  1,Pump,1,1,1
+Pump 1,Pump,3,1,1
+Pump 11,Pump,9,1,1""")})
+        self.assertEqual(response.data['counts'], {'added': 1, 'removed': 0, 'changed': 1, 'unchanged': 1})
+        self.assertEqual(response.data['added'][0]['name'], 'Pump 11')
+        self.assertEqual(response.data['changed'][0]['flowrate'], {'base': 2.0, 'target': 3.0, 'delta': 1.0})
+
+        self.assertEqual(self.client.get('/api/datasets/compare/', {'base': base}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/datasets/compare/', {'base': '99999999999999999999999', 'target': target})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/datasets/compare/', {'base': base, 'target': 9999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_dataset_equipment_keyset_pagination(self):
+        """Test walking a dataset's equipment with cursors"""
+        import base64
+        import json
+
+        Equipment.objects.bulk_create([
+            Equipment(dataset=self.dataset, name=f'Pump-{i % 5}', equipment_type='Pump', flowrate=float(i))
+            for i in range(25)
+        ])
+        expected = list(Equipment.objects.order_by('name', 'id').values_list('id', flat=True))
+
+        response = self.client.get(f'/api/datasets/{self.dataset.id}/equipment/?page_size=10&count=true')
+        self.assertEqual(response.data['count'], 25)
+        self.assertIsNone(response.data['previous'])
+
+        seen = [row['id'] for row in response.data['results']]
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertNotIn('count', response.data)
+            seen += [row['id'] for row in response.data['results']]
+            pages.append(response.data)
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+
+        def cursor(position):
+            return base64.urlsafe_b64encode(json.dumps({'p': position, 'r': False}).encode()).decode()
+
+        # Crafted cursors whose values do not fit the ordering fields
+        for position in (['x', 1180591620717411303424], ['x', 'y'], [None, 1], [1, 1], ['x', True]):
+            for url in (f'/api/datasets/{self.dataset.id}/equipment/', '/api/equipment/'):
+                response = self.client.get(url, {'cursor': cursor(position)})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for position in ([float('nan'), 1], ['x', 1], [None, 1]):
+            response = self.client.get('/api/equipment/', {'cursor': cursor(position), 'ordering': 'flowrate'})
+            expected = status.HTTP_200_OK if position[0] is None else status.HTTP_404_NOT_FOUND
+            self.assertEqual(response.status_code, expected)
+    
+    def test_equipment_filters_and_ordering(self):
+        """Test equipment filters, range bounds and keyset ordering with NULLs"""
+        Equipment.objects.bulk_create([
+            Equipment(
+                dataset=self.dataset, name=f'Unit-{i:02d}', equipment_type='Pump' if i % 2 else 'Reactor',
+                flowrate=None if i % 4 == 0 else float(i % 7), pressure=float(i)
+            )
+            for i in range(24)
+        ])
+        other = Dataset.objects.create(user=self.user, filename='other.csv')
+        Equipment.objects.create(dataset=other, name='Other-01', equipment_type='Pump', pressure=5.0)
+
+        def walk(query):
+            response = self.client.get(f'/api/equipment/?page_size=4&{query}')
+            rows = response.data['results']
+            while response.data['next']:
+                response = self.client.get(response.data['next'])
+                rows += response.data['results']
+            return rows
+
+        rows = walk(f'dataset={self.dataset.id}&equipment_type=Pump&min_pressure=5&max_pressure=15')
+        self.assertEqual([row['name'] for row in rows], [f'Unit-{i:02d}' for i in range(5, 16, 2)])
+        self.assertEqual(len(walk('equipment_type=Pump,Reactor&min_pressure=5&max_pressure=5')), 2)
+
+        # NULLs sort first ascending and last descending, ties broken by id
+        equipment = Equipment.objects.filter(dataset=self.dataset)
+        ascending = sorted(equipment, key=lambda e: (e.flowrate is not None, e.flowrate or 0, e.id))
+        rows = walk(f'dataset={self.dataset.id}&ordering=flowrate')
+        self.assertEqual([row['id'] for row in rows], [e.id for e in ascending])
+        rows = walk(f'dataset={self.dataset.id}&ordering=-flowrate')
+        self.assertEqual([row['id'] for row in rows], [e.id for e in reversed(ascending)])
+
+        for query in ('ordering=size', 'min_flowrate=abc', 'max_pressure=nan', 'dataset=x',
+                      'dataset=99999999999999999999999', 'dataset=-1'):
+            response = self.client.get(f'/api/equipment/?{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+    
+    def test_equipment_filters_use_indexes(self):
+        """Test filtered equipment queries are index searches (EXPLAIN QUERY PLAN)"""
+        from django.db import connection
+
+        def plan(query):
+            statements = []
+            
+            def capture(execute, sql, params, many, context):
+                statements.append((sql, params))
+                return execute(sql, params, many, context)
+            
+            with connection.execute_wrapper(capture):
+                self.client.get(f'/api/equipment/?{query}')
+            sql, params = [s for s in statements if 'FROM "api_equipment"' in s[0]][-1]
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+
+        dataset = self.dataset.id
+        expected = {
+            f'dataset={dataset}&equipment_type=Pump': '(dataset_id=? AND equipment_type=?)',
+            f'dataset={dataset}&min_pressure=1&max_pressure=2&ordering=pressure': '(dataset_id=? AND pressure>? AND pressure<?)',
+            f'dataset={dataset}&min_flowrate=1&ordering=-flowrate': '(dataset_id=? AND flowrate>?)',
+            f'dataset={dataset}&ordering=temperature': '(dataset_id=?)',
+        }
+        for query, search in expected.items():
+            with self.subTest(query=query):
+                explained = plan(query)
+                self.assertIn(search, explained)
+                self.assertNotIn('SCAN api_equipment', explained)
+                self.assertNotIn('TEMP B-TREE', explained)
+
+        # Across the user's datasets each one is searched, then merged
+        explained = plan('equipment_type=Pump&ordering=name')
+        self.assertIn('(dataset_id=? AND equipment_type=?)', explained)
+        self.assertNotIn('SCAN api_equipment', explained)
+    
+    def test_dataset_ndjson_export(self):
+        """Test the export streams one JSON object per equipment row"""
+        import json
+        from chemequip_backend.api.serializers import EquipmentSerializer
+
+        Equipment.objects.bulk_create([
+            Equipment(dataset=self.dataset, name=f'Pump-{i:02d}', equipment_type='Pump',
+                      flowrate=float(i), pressure=None, temperature=20.5)
+            for i in range(5)
+        ])
+
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(f'/api/datasets/{self.dataset.id}/export/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        expected = EquipmentSerializer(Equipment.objects.order_by('name', 'id'), many=True).data
+        self.assertEqual([json.loads(line) for line in lines], [dict(row) for row in expected])
+    
+    def test_fast_equipment_serialization_matches_serializer(self):
+        """Test the values_list() and orjson path renders the same bytes as DRF"""
+        from unittest import mock
+        from rest_framework.renderers import JSONRenderer
+        from chemequip_backend.api.renderers import FastJSONRenderer
+        from chemequip_backend.api.serializers import EquipmentSerializer, EquipmentRowSerializer
+
+        for i, value in enumerate([150.5, None, 1e16, 0.00001, 137.00000000000003, -0.0]):
+            Equipment.objects.create(
+                dataset=self.dataset, name=f'Échangeur\u2028{i}', equipment_type='Heat Exchanger',
+                flowrate=value, pressure=12.0, temperature=-3.25
+            )
+        equipment = Equipment.objects.filter(dataset=self.dataset).order_by('name', 'id')
+
+        expected = JSONRenderer().render(EquipmentSerializer(equipment, many=True).data)
+        serializer = EquipmentRowSerializer()
+        rows = serializer.to_representation(equipment.values_list(*serializer.fields))
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+        self.assertEqual(FastJSONRenderer().render(rows[:1]), JSONRenderer().render(rows[:1]))
+
+        response = self.client.get(f'/api/datasets/{self.dataset.id}/equipment/', {'page_size': 100})
+        self.assertEqual(response.content, JSONRenderer().render(
+            {'next': None, 'previous': None, 'results': EquipmentSerializer(equipment, many=True).data}
+        ))
+
+        # Names that look like exponents ('e-', 'e0') stay on the orjson path
+        Equipment.objects.filter(dataset=self.dataset).delete()
+        Equipment.objects.bulk_create([
+            Equipment(dataset=self.dataset, name=name, equipment_type='Other', flowrate=1.5, pressure=2e-3)
+            for name in ('Valve-01', 'Pipe-2', 'Line-3', 'Tube0e5')
+        ])
+        rows = serializer.to_representation(equipment.values_list(*serializer.fields))
+        expected = JSONRenderer().render(rows)
+        with mock.patch.object(JSONRenderer, 'render', side_effect=AssertionError('fell back to JSONRenderer')):
+            self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Test cases asserting endpoints run a fixed number of queries"""
+    
+    # Endpoint -> maximum number of queries, including token authentication
+    BUDGETS = {
+        '/api/datasets/': 3,
+        '/api/datasets/{id}/': 2,
+        '/api/datasets/{id}/?include=equipment,user': 3,
+        '/api/datasets/{id}/summary/': 4,
+        '/api/datasets/{id}/equipment/': 3,
+        '/api/equipment/': 2,
+        '/api/summary/summary/': 4,
+    }
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        from rest_framework.authtoken.models import Token
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        cache.clear()
+    
+    def create_datasets(self, datasets, rows):
+        from chemequip_backend.api.utils import aggregate_equipment_state
+
+        for i in range(datasets):
+            dataset = Dataset.objects.create(user=self.user, filename=f'test-{i}.csv', equipment_count=rows)
+            Equipment.objects.bulk_create([
+                Equipment(dataset=dataset, name=f'Pump-{j}', equipment_type='Pump', flowrate=float(j))
+                for j in range(rows)
+            ])
+            dataset.stats_state = aggregate_equipment_state(dataset.equipment.all())
+            dataset.save()
+        return dataset
+    
+    def assertEndpointsWithinBudget(self, dataset):
+        for endpoint, budget in self.BUDGETS.items():
+            url = endpoint.format(id=dataset.id)
+            with self.subTest(url=url), self.assertQueryBudget(budget):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_budget_with_one_small_dataset(self):
+        """Test endpoint query counts with little data"""
+        self.assertEndpointsWithinBudget(self.create_datasets(1, 2))
+    
+    def test_budget_with_many_datasets_and_rows(self):
+        """Test endpoint query counts do not grow with datasets or rows"""
+        self.assertEndpointsWithinBudget(self.create_datasets(8, 40))
+    
+    def test_query_headers(self):
+        """Test the middleware reports query count and time when enabled"""
+        dataset = self.create_datasets(1, 2)
+
+        with self.settings(QUERY_INSTRUMENTATION=True):
+            response = self.client.get(f'/api/datasets/{dataset.id}/summary/')
+        self.assertEqual(response['X-Query-Count'], '3')
+        self.assertIn('X-Query-Time-Ms', response)
+
+        with self.settings(QUERY_INSTRUMENTATION=False):
+            response = self.client.get(f'/api/datasets/{dataset.id}/summary/')
+        self.assertNotIn('X-Query-Count', response)
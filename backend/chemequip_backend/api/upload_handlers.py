@@ -0,0 +1,112 @@
+"""
+Upload handlers for streaming CSV files
+"""
+import codecs
+import csv
+import hashlib
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+
+class StreamingCSVUploadHandler(FileUploadHandler):
+    """
+    Spool CSV uploads straight to disk, validating them as they stream in
+
+    Each chunk of the request body is written to a temporary file and run
+    through an incremental UTF-8 decoder, so the upload never sits in memory
+    as a whole. The header row is checked as soon as it has arrived, and
+    the content is hashed on the way through. The returned file carries
+    ``csv_error`` and ``content_hash`` (SHA-256 hex digest) attributes;
+    the rows themselves are parsed in batches by process_csv_file.
+
+    Files that are not ``.csv`` are left to the next handler.
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        # Read per request so the setting can be changed after import
+        self.chunk_size = getattr(settings, 'CSV_UPLOAD_CHUNK_SIZE', 64 * 2 ** 10)
+        self.csv_file = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+
+        if not self.file_name or not self.file_name.lower().endswith('.csv'):
+            self.csv_file = None
+            return
+
+        self.csv_file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.max_size = getattr(settings, 'CSV_UPLOAD_MAX_SIZE', None)
+        self.received = 0
+        self.header = ''
+        self.header_complete = False
+        self.error = None
+        self.hash = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.csv_file is None:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.max_size and self.received > self.max_size:
+            # Keep counting so the size check can reject it, but stop writing
+            return None
+
+        self.csv_file.write(raw_data)
+        self.hash.update(raw_data)
+        if self.error is None:
+            self._scan(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.csv_file is None:
+            return None
+
+        if self.error is None:
+            self._scan(b'', final=True)
+            if not self.header_complete:
+                self._check_header()
+
+        self.csv_file.seek(0)
+        self.csv_file.size = self.received
+        self.csv_file.csv_error = self.error
+        self.csv_file.content_hash = self.hash.hexdigest()
+        return self.csv_file
+
+    def upload_interrupted(self):
+        if self.csv_file is not None:
+            # Closing the temporary file also removes it from disk
+            self.csv_file.close()
+
+    def _scan(self, raw_data, final=False):
+        """
+        Decode a chunk and pick out the header row
+        """
+        try:
+            text = self.decoder.decode(raw_data, final)
+        except UnicodeDecodeError:
+            self.error = "CSV file must be UTF-8 encoded"
+            return
+
+        if not self.header_complete:
+            head, newline, _ = text.partition('\n')
+            self.header += head
+            if newline:
+                self.header_complete = True
+                self._check_header()
+
+    def _header_columns(self):
+        if not self.header.strip():
+            return []
+        return next(csv.reader([self.header.lstrip('\ufeff').rstrip('\r')]))
+
+    def _check_header(self):
+        from chemequip_backend.api.csv_utils import REQUIRED_COLUMNS
+
+        columns = self._header_columns()
+        if not all(col in columns for col in REQUIRED_COLUMNS):
+            self.error = f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}"
@@ -4,13 +4,14 @@ URL routing for API endpoints
 from django.urls import path, include
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.routers import DefaultRouter
-from chemequip_backend.api.views import DatasetViewSet, UserViewSet, SummaryViewSet, EquipmentViewSet
+from chemequip_backend.api.views import DatasetViewSet, UserViewSet, SummaryViewSet, EquipmentViewSet, JobViewSet
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'datasets', DatasetViewSet, basename='dataset')
 router.register(r'equipment', EquipmentViewSet, basename='equipment')
 router.register(r'summary', SummaryViewSet, basename='summary')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,14 +1,91 @@
 """
 Utility functions for CSV processing and analytics
 """
-import pandas as pd
-import io
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+import zipfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
 from django.core.files.base import ContentFile
-from chemequip_backend.api.models import Equipment, Dataset
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.utils import timezone
+from chemequip_backend.api.models import Equipment, Dataset, Job
+from chemequip_backend.api.csv_utils import (
+    REQUIRED_COLUMNS, PARAMETERS, CSVRowError, convert_frame, read_csv_batches,
+    empty_stats_state, frame_stats_state, merge_stats_states, summarize_stats_state,
+    parse_csv_bytes, has_sketches
+)
+from chemequip_backend.api.quantiles import array_sketch
+from chemequip_backend.api.cache_utils import bump_data_version
+from chemequip_backend.api.columnar import (
+    SIDECAR_SUFFIX, open_columnar_writer, load_dataset_columns, columns_stats_state,
+    delete_dataset_columns
+)
 from collections import defaultdict, Counter
 
 
-def process_csv_file(file_obj, dataset_instance):
+def _bulk_insert_frame(frame, dataset_instance, batch_size):
+    """
+    Insert a converted frame as Equipment rows in batches
+
+    Runs one parameterised INSERT through executemany per batch rather than
+    bulk_create: at this volume instantiating and compiling one model per
+    row dominates the cost of the insert itself.
+    """
+    fields = list(frame.columns)
+    columns = [
+        frame[field].astype(object).where(frame[field].notna(), None).tolist()
+        for field in fields
+    ]
+
+    table = connection.ops.quote_name(Equipment._meta.db_table)
+    column_names = ', '.join(
+        connection.ops.quote_name(Equipment._meta.get_field(field).column)
+        for field in ['dataset', 'created_at'] + fields
+    )
+    sql = f"INSERT INTO {table} ({column_names}) VALUES ({', '.join(['%s'] * (len(fields) + 2))})"
+
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    total = len(frame)
+
+    with connection.cursor() as cursor:
+        for start in range(0, total, batch_size):
+            batch = [column[start:start + batch_size] for column in columns]
+            cursor.executemany(sql, [
+                (dataset_instance.pk, created_at) + row for row in zip(*batch)
+            ])
+
+    return total
+
+
+def _save_stats_state(dataset_instance, state):
+    """
+    Store a loaded dataset's statistics state and the summary derived from it
+    """
+    dataset_instance.stats_state = state
+    dataset_instance.summary_stats = summarize_stats_state(state)
+    dataset_instance.equipment_count = state['count']
+    dataset_instance.save()
+
+
+def _write_columns(dataset_instance, frame):
+    """
+    Write the columnar sidecar of a dataset loaded from a single frame
+    """
+    columns_writer = open_columnar_writer(dataset_instance)
+    if columns_writer:
+        columns_writer.append(frame)
+        columns_writer.close()
+
+
+def process_csv_file(file_obj, dataset_instance, batch_size=None):
     """
     Process uploaded CSV file and create Equipment records
     
@@ -18,106 +95,572 @@ def process_csv_file(file_obj, dataset_instance):
     - Flowrate
     - Pressure
     - Temperature
+
+    The file is parsed and written in batches of ``batch_size`` rows
+    (defaults to settings.CSV_INGEST_BATCH_SIZE) inside a single
+    transaction, so a failed upload never leaves a partial dataset behind.
     """
+    batch_size = batch_size or getattr(settings, 'CSV_INGEST_BATCH_SIZE', 2000)
+
+    columns_writer = None
     try:
-        # Reset file pointer to the beginning
-        file_obj.seek(0)
-        # Read CSV file
-        file_content = file_obj.read().decode('utf-8')
-        df = pd.read_csv(io.StringIO(file_content))
+        batches = read_csv_batches(file_obj, batch_size)
+        first_batch = next(batches)
         
         # Validate required columns
-        required_columns = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
-        if not all(col in df.columns for col in required_columns):
-            return False, f"CSV must contain columns: {', '.join(required_columns)}"
+        if not all(col in first_batch.columns for col in REQUIRED_COLUMNS):
+            return False, f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}"
         
-        # Clear existing equipment for this dataset
-        Equipment.objects.filter(dataset=dataset_instance).delete()
-        
-        # Create Equipment records
-        for index, row in df.iterrows():
-            try:
-                equipment = Equipment.objects.create(
-                    dataset=dataset_instance,
-                    name=str(row['Equipment Name']).strip(),
-                    equipment_type=str(row['Type']).strip(),
-                    flowrate=float(row['Flowrate']) if pd.notna(row['Flowrate']) else None,
-                    pressure=float(row['Pressure']) if pd.notna(row['Pressure']) else None,
-                    temperature=float(row['Temperature']) if pd.notna(row['Temperature']) else None,
-                )
-            except Exception as e:
-                return False, f"Error processing row {index + 1}: {str(e)}"
-        
-        # Calculate and store summary statistics
-        stats = calculate_summary_stats(dataset_instance)
-        dataset_instance.summary_stats = stats
-        dataset_instance.equipment_count = Equipment.objects.filter(dataset=dataset_instance).count()
-        dataset_instance.save()
+        columns_writer = open_columnar_writer(dataset_instance)
+        with transaction.atomic():
+            # Clear existing equipment for this dataset
+            Equipment.objects.filter(dataset=dataset_instance).delete()
+
+            # Summary statistics are accumulated batch by batch from the
+            # converted frames, so the inserted rows are never read back
+            state = empty_stats_state()
+            for df in itertools.chain([first_batch], batches):
+                frame = convert_frame(df, row_offset=state['count'])
+                _bulk_insert_frame(frame, dataset_instance, batch_size)
+                state = merge_stats_states([state, frame_stats_state(frame)])
+                if columns_writer:
+                    columns_writer.append(frame)
+
+            _save_stats_state(dataset_instance, state)
+            if columns_writer:
+                columns_writer.close()
         
         return True, "CSV processed successfully"
     
+    except CSVRowError as e:
+        if columns_writer:
+            columns_writer.abort()
+        return False, str(e)
     except Exception as e:
+        if columns_writer:
+            columns_writer.abort()
         return False, f"Error processing CSV: {str(e)}"
 
 
-def calculate_summary_stats(dataset_instance):
+def file_content_hash(file_obj):
+    """
+    Return the SHA-256 hex digest of a file, reading it in chunks
+    """
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(64 * 2 ** 10), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def find_duplicate_dataset(user, content_hash):
+    """
+    Return the user's latest dataset uploaded with the same content, if any
+    """
+    return (
+        Dataset.objects.filter(user=user, content_hash=content_hash)
+        .order_by('-uploaded_at', '-id')
+        .first()
+    )
+
+
+def clone_dataset(source, filename):
+    """
+    Create a new Dataset sharing the file, rows and statistics of ``source``
+
+    The equipment is copied inside the database with one INSERT ... SELECT,
+    so nothing is parsed or sent through Python. The stored file, and
+    with it the columnar sidecar, is referenced rather than copied.
+    """
+    dataset = Dataset.objects.create(
+        user=source.user,
+        filename=filename,
+        file=source.file.name,
+        content_hash=source.content_hash,
+        summary_stats=source.summary_stats,
+        stats_state=source.stats_state,
+        equipment_count=source.equipment_count,
+    )
+    
+    table = connection.ops.quote_name(Equipment._meta.db_table)
+    fields = ['name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
+    columns = ', '.join(connection.ops.quote_name(Equipment._meta.get_field(f).column) for f in fields)
+    dataset_column = connection.ops.quote_name(Equipment._meta.get_field('dataset').column)
+    created_column = connection.ops.quote_name(Equipment._meta.get_field('created_at').column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({dataset_column}, {created_column}, {columns}) "
+            f"SELECT %s, %s, {columns} FROM {table} WHERE {dataset_column} = %s ORDER BY id",
+            [dataset.pk, connection.ops.adapt_datetimefield_value(timezone.now()), source.pk]
+        )
+    
+    dataset.deduplicated = True
+    return dataset
+
+
+def ingest_csv_dataset(user, file_obj, filename):
+    """
+    Create a Dataset for an uploaded CSV file and load its equipment
+
+    The Dataset and its rows are created in one transaction so other
+    requests never observe a dataset that is still being loaded. A file
+    the user already uploaded is not parsed again: its dataset is cloned
+    and the returned dataset has ``deduplicated`` set. Returns (dataset,
+    message); dataset is None when the file was rejected.
+    """
+    content_hash = getattr(file_obj, 'content_hash', None) or file_content_hash(file_obj)
+    
+    with transaction.atomic():
+        source = find_duplicate_dataset(user, content_hash)
+        if source is not None:
+            dataset = clone_dataset(source, filename)
+            bump_data_version(user.pk)
+            return dataset, "CSV already uploaded; reused its processed data"
+        
+        dataset = Dataset.objects.create(
+            user=user,
+            filename=filename,
+            file=file_obj,
+            content_hash=content_hash
+        )
+        
+        success, message = process_csv_file(file_obj, dataset)
+        
+        if not success:
+            dataset.delete()
+            return None, message
+        
+        bump_data_version(user.pk)
+    
+    dataset.deduplicated = False
+    return dataset, message
+
+
+def ingest_csv_archive(user, archive_file, max_workers=None, batch_size=None):
+    """
+    Create one Dataset per CSV member of a ZIP archive
+
+    Members are parsed in a process pool (settings.CSV_ARCHIVE_WORKERS,
+    defaulting to the CPU count); each parsed frame is then inserted into
+    its own Dataset in a separate transaction. Returns a list of per-file
+    result dictionaries in archive order.
+    """
+    batch_size = batch_size or getattr(settings, 'CSV_INGEST_BATCH_SIZE', 2000)
+    max_size = getattr(settings, 'CSV_UPLOAD_MAX_SIZE', None)
+
+    with zipfile.ZipFile(archive_file) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith('.csv')
+            and not os.path.basename(info.filename).startswith('.')
+            and not info.filename.startswith('__MACOSX/')
+        ]
+        if not members:
+            raise ValueError("ZIP archive contains no CSV files")
+        if max_size and sum(info.file_size for info in members) > max_size:
+            raise ValueError(f"Uncompressed CSV files must not exceed {max_size} bytes")
+
+        names = [os.path.basename(info.filename) for info in members]
+        payloads = [archive.read(info) for info in members]
+
+    max_workers = min(
+        max_workers or getattr(settings, 'CSV_ARCHIVE_WORKERS', None) or os.cpu_count() or 1,
+        len(names)
+    )
+
+    # Members already uploaded (earlier, or earlier in this archive) are
+    # cloned instead of parsed
+    hashes = [hashlib.sha256(data).hexdigest() for data in payloads]
+    seen = set(
+        Dataset.objects.filter(user=user, content_hash__in=hashes).values_list('content_hash', flat=True)
+    )
+    duplicate = []
+    for content_hash in hashes:
+        duplicate.append(content_hash in seen)
+        seen.add(content_hash)
+
+    def result(dataset, deduplicated):
+        return {
+            'filename': dataset.filename,
+            'status': 'created',
+            'dataset_id': dataset.id,
+            'equipment_count': dataset.equipment_count,
+            'deduplicated': deduplicated,
+        }
+
+    def store(parsed, data, content_hash):
+        name, frame, state, error = parsed
+        if error:
+            return {'filename': name, 'status': 'error', 'error': error}
+
+        with transaction.atomic():
+            dataset = Dataset.objects.create(
+                user=user,
+                filename=name,
+                file=ContentFile(data, name=name),
+                content_hash=content_hash
+            )
+            _bulk_insert_frame(frame, dataset, batch_size)
+            _save_stats_state(dataset, state)
+            _write_columns(dataset, frame)
+            bump_data_version(user.pk)
+
+        return result(dataset, False)
+
+    def reuse(name, data, content_hash):
+        with transaction.atomic():
+            source = find_duplicate_dataset(user, content_hash)
+            if source is not None:
+                dataset = clone_dataset(source, name)
+                bump_data_version(user.pk)
+                return result(dataset, True)
+        # The earlier copy in this archive was rejected; report its error too
+        return store(parse_csv_bytes(name, data), data, content_hash)
+
+    members = list(zip(names, payloads, hashes))
+    to_parse = [member for member, is_duplicate in zip(members, duplicate) if not is_duplicate]
+    max_workers = min(max_workers, max(len(to_parse), 1))
+
+    def store_all(parsed_members):
+        results = []
+        for (name, data, content_hash), is_duplicate in zip(members, duplicate):
+            if is_duplicate:
+                results.append(reuse(name, data, content_hash))
+            else:
+                results.append(store(next(parsed_members), data, content_hash))
+        return results
+
+    if max_workers <= 1:
+        return store_all(parse_csv_bytes(name, data) for name, data, _ in to_parse)
+
+    # Results are consumed in order as they complete, so inserts for early
+    # members overlap with parsing of later ones
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return store_all(executor.map(
+            parse_csv_bytes,
+            [name for name, _, _ in to_parse],
+            [data for _, data, _ in to_parse]
+        ))
+
+
+def _file_referrers():
+    """
+    Querysets whose ``file`` keeps a stored file alive
+
+    Every dataset, and jobs that have not finished yet: a finished ingest
+    job's file belongs to the dataset it produced, if any.
+    """
+    return [
+        Dataset.objects.all(),
+        Job.objects.filter(state__in=[Job.STATE_QUEUED, Job.STATE_RUNNING]),
+    ]
+
+
+def delete_dataset_files(dataset):
     """
-    Calculate summary statistics for a dataset
-    """
-    equipment_list = Equipment.objects.filter(dataset=dataset_instance)
-    
-    if not equipment_list.exists():
-        return {}
-    
-    flowrates = [e.flowrate for e in equipment_list if e.flowrate is not None]
-    pressures = [e.pressure for e in equipment_list if e.pressure is not None]
-    temperatures = [e.temperature for e in equipment_list if e.temperature is not None]
-    
-    # Equipment type distribution
-    type_distribution = {}
-    for equipment in equipment_list:
-        type_distribution[equipment.equipment_type] = type_distribution.get(equipment.equipment_type, 0) + 1
-    
-    stats = {
-        'total_equipment': equipment_list.count(),
-        'avg_flowrate': round(sum(flowrates) / len(flowrates), 2) if flowrates else 0,
-        'avg_pressure': round(sum(pressures) / len(pressures), 2) if pressures else 0,
-        'avg_temperature': round(sum(temperatures) / len(temperatures), 2) if temperatures else 0,
-        'equipment_type_distribution': type_distribution,
-        'min_flowrate': round(min(flowrates), 2) if flowrates else None,
-        'max_flowrate': round(max(flowrates), 2) if flowrates else None,
-        'min_pressure': round(min(pressures), 2) if pressures else None,
-        'max_pressure': round(max(pressures), 2) if pressures else None,
-        'min_temperature': round(min(temperatures), 2) if temperatures else None,
-        'max_temperature': round(max(temperatures), 2) if temperatures else None,
+    Remove a dataset's stored CSV file, columnar sidecar and cached reports
+
+    The file and sidecar are kept while another dataset or an unfinished
+    job still refers to them.
+    """
+    from chemequip_backend.api.pdf_utils import delete_dataset_reports
+    
+    delete_dataset_reports(dataset)
+    # Deduplicated uploads share the file (and sidecar) of the first copy
+    datasets, jobs = _file_referrers()
+    shared = (
+        datasets.filter(file=dataset.file.name).exclude(pk=dataset.pk).exists()
+        or jobs.filter(file=dataset.file.name).exists()
+    )
+    if dataset.file and not shared:
+        delete_dataset_columns(dataset)
+        dataset.file.delete(save=False)
+
+
+def _delete_where_in(model, field, values, batch_size=500):
+    """
+    DELETE rows of ``model`` whose ``field`` is in ``values`` with raw SQL
+
+    Skips Django's deletion collector, which fetches every related row
+    before deleting it. Callers are responsible for related rows.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", batch)
+
+
+def apply_dataset_retention(user):
+    """
+    Keep only the user's last DATASET_RETENTION_COUNT datasets
+
+    Older datasets are removed with set-based DELETEs (their equipment,
+    then the datasets themselves) in a constant number of queries. Their
+    files are left on disk for the collect_garbage command.
+    """
+    keep = getattr(settings, 'DATASET_RETENTION_COUNT', 5)
+    if keep is None:
+        return
+    
+    old_ids = list(
+        Dataset.objects.filter(user=user)
+        .order_by('-uploaded_at', '-id')
+        .values_list('id', flat=True)[keep:]
+    )
+    if not old_ids:
+        return
+    
+    with transaction.atomic():
+        Job.objects.filter(dataset_id__in=old_ids).update(dataset=None)
+        _delete_where_in(Equipment, 'dataset', old_ids)
+        _delete_where_in(Dataset, 'id', old_ids)
+        bump_data_version(user.pk)
+
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(dirpath, name))
+            for dirpath, _, filenames in os.walk(path) for name in filenames
+        )
+    return os.path.getsize(path)
+
+
+def _stored_paths(top):
+    """
+    Yield (path, is_sidecar) for every stored file and sidecar under ``top``
+    """
+    for dirpath, dirnames, filenames in os.walk(default_storage.path(top)):
+        for name in list(dirnames):
+            if SIDECAR_SUFFIX in name:
+                # Sidecars are removed as a whole, never descended into
+                dirnames.remove(name)
+                yield os.path.join(dirpath, name), True
+        for name in filenames:
+            yield os.path.join(dirpath, name), False
+
+
+def collect_orphaned_files(min_age=3600, batch_size=1000, dry_run=False):
+    """
+    Delete uploaded files and sidecars no dataset or unfinished job refers to
+
+    Dataset retention only deletes rows, so this is where their files go,
+    along with files orphaned any other way (failed uploads, interrupted
+    sidecar writes). Paths are checked against the database in batches of
+    ``batch_size``. Anything modified in the last ``min_age`` seconds is
+    kept, since an upload stores its file before the row referring to it
+    is committed. Returns {'files', 'sidecars', 'bytes'}.
+    """
+    referrers = _file_referrers()
+    tops = sorted({
+        queryset.model._meta.get_field('file').upload_to.split('/')[0] for queryset in referrers
+    })
+    media_root = default_storage.path('')
+    cutoff = time.time() - min_age
+    collected = {'files': 0, 'sidecars': 0, 'bytes': 0}
+    
+    def file_name(path, is_sidecar):
+        name = os.path.relpath(path, media_root).replace(os.sep, '/')
+        # <file>.columns and interrupted <file>.columns.tmp-* belong to <file>
+        return name[:name.index(SIDECAR_SUFFIX)] if is_sidecar else name
+    
+    paths = itertools.chain.from_iterable(_stored_paths(top) for top in tops)
+    while True:
+        batch = list(itertools.islice(paths, batch_size))
+        if not batch:
+            break
+        
+        names = {file_name(path, is_sidecar) for path, is_sidecar in batch}
+        referenced = set()
+        for queryset in referrers:
+            referenced.update(queryset.filter(file__in=names).values_list('file', flat=True))
+        
+        for path, is_sidecar in batch:
+            temporary = is_sidecar and not path.endswith(SIDECAR_SUFFIX)
+            if file_name(path, is_sidecar) in referenced and not temporary:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                size = _path_size(path)
+                if not dry_run:
+                    if is_sidecar:
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+            except FileNotFoundError:
+                continue
+            collected['sidecars' if is_sidecar else 'files'] += 1
+            collected['bytes'] += size
+    
+    return collected
+
+
+def format_datetime(value, tz=None):
+    """
+    Format a datetime the way DRF's DateTimeField renders it
+
+    ``tz`` defaults to the current time zone; pass it in when formatting
+    many values to avoid looking it up each time.
+    """
+    if value is None:
+        return None
+    value = timezone.localtime(value, tz) if timezone.is_aware(value) else value
+    text = value.isoformat()
+    if text.endswith('+00:00'):
+        text = text[:-6] + 'Z'
+    return text
+
+
+def iter_equipment_ndjson(queryset, fields, chunk_size=None):
+    """
+    Yield Equipment rows as newline-delimited JSON, one chunk of lines at a time
+
+    Rows are read with values_list() through a chunked database iterator,
+    so memory use stays flat however large the queryset is.
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    datetime_fields = {
+        i for i, field in enumerate(fields)
+        if Equipment._meta.get_field(field).get_internal_type() == 'DateTimeField'
     }
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    tz = timezone.get_current_timezone()
     
-    return stats
+    lines = []
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        if datetime_fields:
+            row = [format_datetime(v, tz) if i in datetime_fields else v for i, v in enumerate(row)]
+        lines.append(encode(dict(zip(fields, row))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def aggregate_equipment_state(queryset):
+    """
+    Compute the statistics accumulator of an Equipment queryset in the database
+
+    Issues one aggregate query for the per-parameter count, sum, sum of
+    squares, min and max, one grouped query for the type counts and one
+    scan of the parameter columns for the quantile sketches.
+    """
+    queryset = queryset.order_by()
+
+    aggregates = {'total': Count('id')}
+    for field in PARAMETERS:
+        aggregates[f'{field}_count'] = Count(field)
+        aggregates[f'{field}_sum'] = Sum(field)
+        aggregates[f'{field}_sum_sq'] = Sum(F(field) * F(field))
+        aggregates[f'{field}_min'] = Min(field)
+        aggregates[f'{field}_max'] = Max(field)
+    values = queryset.aggregate(**aggregates)
+
+    state = empty_stats_state()
+    if not values['total']:
+        return state
+
+    state['count'] = values['total']
+    state['types'] = dict(
+        queryset.values_list('equipment_type').annotate(count=Count('id')).values_list('equipment_type', 'count')
+    )
+    # Stream the rows in chunks straight into one float array, no row list
+    rows = queryset.values_list(*PARAMETERS).iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+    flat = (np.nan if value is None else value for row in rows for value in row)
+    columns = np.fromiter(flat, dtype=np.float64).reshape(-1, len(PARAMETERS))
+    for i, field in enumerate(PARAMETERS):
+        state[field] = {
+            'count': values[f'{field}_count'],
+            'sum': values[f'{field}_sum'] or 0.0,
+            'sum_sq': values[f'{field}_sum_sq'] or 0.0,
+            'min': values[f'{field}_min'],
+            'max': values[f'{field}_max'],
+            'sketch': array_sketch(columns[:, i]),
+        }
+    return state
+
+
+def compute_dataset_stats_state(dataset_instance):
+    """
+    Compute a dataset's statistics accumulator from its rows
+
+    Reads the memory-mapped columnar sidecar when the dataset has one and
+    aggregates in the database otherwise.
+    """
+    columns = load_dataset_columns(dataset_instance)
+    if columns is not None:
+        return columns_stats_state(columns)
+    return aggregate_equipment_state(Equipment.objects.filter(dataset=dataset_instance))
+
+
+def dataset_stats_state(dataset_instance):
+    """
+    Return a dataset's statistics accumulator
+
+    Uses the accumulator stored at ingest when it is complete. Otherwise
+    (datasets loaded before it, or its quantile sketches, were recorded)
+    it is computed once from the rows and saved for next time;
+    backfill_stats_states does this ahead of time.
+    """
+    state = dataset_instance.stats_state
+    if not has_sketches(state):
+        state = compute_dataset_stats_state(dataset_instance)
+        Dataset.objects.filter(id=dataset_instance.id).update(stats_state=state)
+        dataset_instance.stats_state = state
+    return state
+
+
+def calculate_summary_stats(dataset_instance):
+    """
+    Calculate summary statistics for a dataset from its accumulator
+    """
+    return summarize_stats_state(dataset_stats_state(dataset_instance))
+
+
+def get_dataset_stats_states(datasets):
+    """
+    Return the statistics accumulators of a Dataset queryset
+
+    See dataset_stats_state for datasets without a complete stored state.
+    """
+    return [
+        dataset_stats_state(dataset)
+        for dataset in datasets.order_by().only('id', 'file', 'stats_state')
+    ]
 
 
 def get_user_summary(user):
     """
     Get summary statistics for all datasets of a user
+
+    Merges the per-dataset statistics states, so the cost grows with the
+    number of datasets rather than the number of equipment rows. Deleted
+    datasets simply drop out of the merge. Medians and p95s are read from
+    the merged quantile sketches.
     """
     datasets = Dataset.objects.filter(user=user).order_by('-uploaded_at')[:5]
     
-    all_equipment = Equipment.objects.filter(dataset__user=user)
-    
-    flowrates = [e.flowrate for e in all_equipment if e.flowrate is not None]
-    pressures = [e.pressure for e in all_equipment if e.pressure is not None]
-    temperatures = [e.temperature for e in all_equipment if e.temperature is not None]
-    
-    type_distribution = {}
-    for equipment in all_equipment:
-        type_distribution[equipment.equipment_type] = type_distribution.get(equipment.equipment_type, 0) + 1
+    state = merge_stats_states(get_dataset_stats_states(Dataset.objects.filter(user=user)))
+    stats = summarize_stats_state(state)
     
     summary = {
-        'total_equipment': all_equipment.count(),
-        'avg_flowrate': round(sum(flowrates) / len(flowrates), 2) if flowrates else 0,
-        'avg_pressure': round(sum(pressures) / len(pressures), 2) if pressures else 0,
-        'avg_temperature': round(sum(temperatures) / len(temperatures), 2) if temperatures else 0,
-        'equipment_type_distribution': type_distribution,
+        'total_equipment': stats.get('total_equipment', 0),
+        'avg_flowrate': stats.get('avg_flowrate', 0),
+        'avg_pressure': stats.get('avg_pressure', 0),
+        'avg_temperature': stats.get('avg_temperature', 0),
+        'equipment_type_distribution': stats.get('equipment_type_distribution', {}),
         'recent_datasets': datasets,
     }
+    for field in PARAMETERS:
+        summary[f'median_{field}'] = stats.get(f'median_{field}')
+        summary[f'p95_{field}'] = stats.get(f'p95_{field}')
     
     return summary
@@ -3,22 +3,55 @@ API Views for chemical equipment data visualization
 """
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.db import transaction
 from django.contrib.auth.models import User
-from chemequip_backend.api.models import Dataset, Equipment
+from chemequip_backend.api.models import Dataset, Equipment, Job
 from chemequip_backend.api.serializers import (
     DatasetDetailSerializer, DatasetListSerializer, 
-    CSVUploadSerializer, DataSummarySerializer, EquipmentSerializer, UserSerializer
+    CSVUploadSerializer, DataSummarySerializer, EquipmentSerializer, EquipmentRowSerializer,
+    JobSerializer, UserSerializer, ZIPUploadSerializer
 )
-from chemequip_backend.api.utils import process_csv_file, get_user_summary, calculate_summary_stats
-from chemequip_backend.api.pdf_utils import generate_pdf_report
+from chemequip_backend.api.utils import (
+    ingest_csv_dataset, ingest_csv_archive, apply_dataset_retention, get_user_summary,
+    calculate_summary_stats, iter_equipment_ndjson, delete_dataset_files
+)
+from chemequip_backend.api.jobs import enqueue_csv_ingest, enqueue_pdf_report
+from chemequip_backend.api.cache_utils import cached_response, bump_data_version
+from chemequip_backend.api.pdf_utils import get_pdf_report
+from chemequip_backend.api.comparison import compare_datasets, parse_compare_params
+from chemequip_backend.api.analytics import (
+    dataset_histogram, parse_histogram_params, chart_data, parse_chart_params
+)
+from chemequip_backend.api.pagination import KeysetPagination
+from chemequip_backend.api.filters import EquipmentFilterBackend, equipment_ordering, MAX_ID
+from chemequip_backend.api.download_utils import file_download_response
 import os
+import zipfile
+
+
+class IdLookupMixin:
+    """
+    Answer detail URLs with an id the database cannot hold with a 404
+
+    Runs before any action, so lookups never reach the database with a
+    non-numeric or out-of-range id.
+    """
+    not_found_detail = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if pk is not None and not (pk.isascii() and pk.isdigit() and 1 <= int(pk) <= MAX_ID):
+            raise NotFound(self.not_found_detail)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(IdLookupMixin, viewsets.ModelViewSet):
     """
     ViewSet for User registration and management
     """
@@ -91,10 +124,11 @@ class UserViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_200_OK)
 
 
-class DatasetViewSet(viewsets.ModelViewSet):
+class DatasetViewSet(IdLookupMixin, viewsets.ModelViewSet):
     """
     ViewSet for Dataset management and CSV upload
     """
+    not_found_detail = {'error': 'Dataset not found'}
     serializer_class = DatasetDetailSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
@@ -103,7 +137,12 @@ class DatasetViewSet(viewsets.ModelViewSet):
         """
         Return datasets for the current user
         """
-        return Dataset.objects.filter(user=self.request.user)
+        queryset = Dataset.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            # Load only what the requested projection emits
+            serializer_class = self.get_serializer_class()
+            queryset = serializer_class.project_queryset(queryset, self.get_serializer_context())
+        return queryset
     
     def get_serializer_class(self):
         """
@@ -113,6 +152,24 @@ class DatasetViewSet(viewsets.ModelViewSet):
             return DatasetListSerializer
         return DatasetDetailSerializer
     
+    def perform_destroy(self, instance):
+        """
+        Delete a dataset with its files and invalidate the owner's cached summaries
+        """
+        delete_dataset_files(instance)
+        with transaction.atomic():
+            instance.delete()
+            bump_data_version(instance.user_id)
+    
+    def _wants_async(self, request, setting='CSV_UPLOAD_ASYNC'):
+        """
+        Whether work should be queued instead of done inline
+        """
+        value = request.query_params.get('async', request.data.get('async'))
+        if value is None:
+            return getattr(settings, setting, False)
+        return str(value).lower() in ('1', 'true', 'yes')
+    
     @action(detail=False, methods=['post'])
     def upload_csv(self, request):
         """
@@ -125,44 +182,75 @@ class DatasetViewSet(viewsets.ModelViewSet):
         
         file_obj = serializer.validated_data['file']
         
-        # Create Dataset instance
-        dataset = Dataset.objects.create(
-            user=request.user,
-            filename=file_obj.name,
-            file=file_obj
-        )
+        # Problems spotted by StreamingCSVUploadHandler while the file arrived
+        upload_error = getattr(file_obj, 'csv_error', None)
+        if upload_error:
+            return Response({'error': upload_error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if self._wants_async(request):
+            job = enqueue_csv_ingest(request.user, file_obj)
+            return Response(
+                {
+                    'message': 'CSV queued for processing',
+                    'job': JobSerializer(job).data
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
         
         # Process CSV
-        success, message = process_csv_file(file_obj, dataset)
+        dataset, message = ingest_csv_dataset(request.user, file_obj, file_obj.name)
         
-        if not success:
-            dataset.delete()
+        if dataset is None:
             return Response(
                 {'error': message},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Keep only last 5 datasets
-        all_datasets = Dataset.objects.filter(user=request.user).order_by('-uploaded_at')
-        if all_datasets.count() > 5:
-            old_datasets = all_datasets[5:]
-            for old_dataset in old_datasets:
-                if old_dataset.file:
-                    old_dataset.file.delete()
-                old_dataset.delete()
+        apply_dataset_retention(request.user)
         
+        # Metadata and stats only; the rows are available from equipment/
         return Response(
             {
                 'message': message,
+                'deduplicated': dataset.deduplicated,
                 'dataset': DatasetDetailSerializer(dataset).data
             },
             status=status.HTTP_201_CREATED
         )
     
+    @action(detail=False, methods=['post'])
+    def upload_zip(self, request):
+        """
+        Handle upload of a ZIP archive of CSV files, one dataset per file
+        """
+        serializer = ZIPUploadSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            results = ingest_csv_archive(request.user, serializer.validated_data['file'])
+        except (zipfile.BadZipFile, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        created = sum(1 for result in results if result['status'] == 'created')
+        
+        # Retention runs once for the whole batch
+        if created:
+            apply_dataset_retention(request.user)
+        
+        return Response(
+            {
+                'message': f"{created} of {len(results)} CSV files processed successfully",
+                'results': results
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+    
     @action(detail=True, methods=['get'])
     def equipment(self, request, pk=None):
         """
-        Get all equipment for a specific dataset
+        Get equipment for a specific dataset, one keyset page at a time
         """
         try:
             dataset = Dataset.objects.get(id=pk, user=request.user)
@@ -172,55 +260,178 @@ class DatasetViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        equipment = Equipment.objects.filter(dataset=dataset)
-        serializer = EquipmentSerializer(equipment, many=True)
-        return Response(serializer.data)
+        serializer = EquipmentRowSerializer()
+        equipment = Equipment.objects.filter(dataset=dataset).values_list(*serializer.fields)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(equipment, request, view=self)
+        return paginator.get_paginated_response(serializer.to_representation(page))
 
     @action(detail=True, methods=['get'])
-    def summary(self, request, pk=None):
+    def export(self, request, pk=None):
         """
-        Get summary statistics for a specific dataset
+        Stream all equipment of a dataset as newline-delimited JSON
         """
         try:
             dataset = Dataset.objects.get(id=pk, user=request.user)
         except Dataset.DoesNotExist:
             return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        equipment = Equipment.objects.filter(dataset=dataset).order_by('name', 'id')
+        filename = f"{dataset.filename.replace('.csv', '')}.ndjson"
+        
+        response = StreamingHttpResponse(
+            iter_equipment_ndjson(equipment, EquipmentSerializer.Meta.fields),
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Download the original CSV file of a dataset
+        """
+        try:
+            dataset = Dataset.objects.get(id=pk, user=request.user)
+        except Dataset.DoesNotExist:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if not dataset.file or not dataset.file.storage.exists(dataset.file.name):
+            return Response({'error': 'Dataset file not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return file_download_response(request, dataset.file, dataset.filename, 'text/csv')
+    
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """
+        Get summary statistics for a specific dataset
+        """
+        def build():
+            try:
+                dataset = Dataset.objects.get(id=pk, user=request.user)
+            except (Dataset.DoesNotExist, ValueError):
+                return None
 
-        stats = calculate_summary_stats(dataset)
+            stats = calculate_summary_stats(dataset)
 
-        # Adapt keys to the desktop client expectations
-        summary_payload = {
-            'count': stats.get('total_equipment', 0),
-            'averages': {
-                'flowrate': stats.get('avg_flowrate'),
-                'pressure': stats.get('avg_pressure'),
-                'temperature': stats.get('avg_temperature'),
-            },
-            'type_distribution': stats.get('equipment_type_distribution', {}),
-        }
+            # Adapt keys to the desktop client expectations
+            return {
+                'count': stats.get('total_equipment', 0),
+                'averages': {
+                    'flowrate': stats.get('avg_flowrate'),
+                    'pressure': stats.get('avg_pressure'),
+                    'temperature': stats.get('avg_temperature'),
+                },
+                'medians': {
+                    'flowrate': stats.get('median_flowrate'),
+                    'pressure': stats.get('median_pressure'),
+                    'temperature': stats.get('median_temperature'),
+                },
+                'p95': {
+                    'flowrate': stats.get('p95_flowrate'),
+                    'pressure': stats.get('p95_pressure'),
+                    'temperature': stats.get('p95_temperature'),
+                },
+                'type_distribution': stats.get('equipment_type_distribution', {}),
+            }
 
-        return Response(summary_payload)
+        response = cached_response(request, f'dataset-summary:{pk}', build)
+        if response is None:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def histogram(self, request, pk=None):
+        """
+        Get histogram bins and percentiles of one parameter of a dataset
+        """
+        param, bins, error = parse_histogram_params(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def build():
+            try:
+                dataset = Dataset.objects.get(id=pk, user=request.user)
+            except (Dataset.DoesNotExist, ValueError):
+                return None
+            return dataset_histogram([dataset], param, bins)
+        
+        response = cached_response(request, f'dataset-histogram:{pk}:{param}:{bins}', build)
+        if response is None:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def compare(self, request):
+        """
+        Compare the equipment and statistics of two datasets
+        """
+        base_id, target_id, limit, error = parse_compare_params(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def build():
+            datasets = Dataset.objects.filter(user=request.user, id__in=[base_id, target_id]).in_bulk()
+            if base_id not in datasets or target_id not in datasets:
+                return None
+            return compare_datasets(datasets[base_id], datasets[target_id], limit)
+        
+        # Datasets never change, so the result only depends on the ids
+        response = cached_response(request, f'dataset-compare:{base_id}:{target_id}:{limit}', build)
+        if response is None:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def chart_data(self, request, pk=None):
+        """
+        Get a bounded-size sample or density grid for plotting parameters
+        """
+        options, error = parse_chart_params(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def build():
+            try:
+                dataset = Dataset.objects.get(id=pk, user=request.user)
+            except (Dataset.DoesNotExist, ValueError):
+                return None
+            return chart_data(dataset, **options)
+        
+        size = options.get('points', options.get('resolution'))
+        name = f"dataset-chart:{pk}:{options['mode']}:{','.join(options['params'])}:{size}"
+        response = cached_response(request, name, build)
+        if response is None:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        return response
     
     @action(detail=True, methods=['get'])
     def generate_pdf(self, request, pk=None):
         """
         Generate and download PDF report for a dataset
         """
-        buffer, message = generate_pdf_report(pk, request.user)
+        try:
+            dataset = Dataset.objects.get(id=pk, user=request.user)
+        except Dataset.DoesNotExist:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        if buffer is None:
+        # ?mode=summary leaves out the equipment details section
+        summary_only = request.query_params.get('mode') == 'summary'
+        
+        if self._wants_async(request, 'PDF_REPORT_ASYNC'):
+            job = enqueue_pdf_report(request.user, dataset, summary_only)
             return Response(
-                {'error': message},
-                status=status.HTTP_404_NOT_FOUND
+                {
+                    'message': 'PDF report queued for generation',
+                    'job': JobSerializer(job).data
+                },
+                status=status.HTTP_202_ACCEPTED
             )
         
-        # Get dataset for filename
-        dataset = Dataset.objects.get(id=pk, user=request.user)
+        # Served from the report cache unless the dataset's report changed
+        report, etag = get_pdf_report(dataset, summary_only)
         filename = f"Report_{dataset.filename.replace('.csv', '')}.pdf"
-        
-        response = FileResponse(buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        return file_download_response(request, report, filename, 'application/pdf', etag=etag)
 
 
 class SummaryViewSet(viewsets.ViewSet):
@@ -234,27 +445,95 @@ class SummaryViewSet(viewsets.ViewSet):
         """
         Get summary statistics for all user's data
         """
-        summary = get_user_summary(request.user)
+        def build():
+            summary = get_user_summary(request.user)
+            
+            # Serialize datasets
+            summary['recent_datasets'] = DatasetListSerializer(
+                summary['recent_datasets'],
+                many=True
+            ).data
+            return summary
+        
+        return cached_response(request, 'user-summary', build)
+    
+    @action(detail=False, methods=['get'])
+    def histogram(self, request):
+        """
+        Get histogram bins and percentiles of one parameter over all user's data
+        """
+        param, bins, error = parse_histogram_params(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Serialize datasets
-        from chemequip_backend.api.serializers import DatasetListSerializer
-        summary['recent_datasets'] = DatasetListSerializer(
-            summary['recent_datasets'],
-            many=True
-        ).data
+        def build():
+            return dataset_histogram(Dataset.objects.filter(user=request.user), param, bins)
         
-        return Response(summary)
+        return cached_response(request, f'user-histogram:{param}:{bins}', build)
 
 
-class EquipmentViewSet(viewsets.ReadOnlyModelViewSet):
+class EquipmentViewSet(IdLookupMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for Equipment (read-only)
     """
     serializer_class = EquipmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    filter_backends = [EquipmentFilterBackend]
     
     def get_queryset(self):
         """
         Return equipment for datasets of the current user
         """
         return Equipment.objects.filter(dataset__user=self.request.user)
+    
+    @property
+    def keyset_ordering(self):
+        """
+        Keyset ordering selected with ?ordering= (default name)
+        """
+        return equipment_ordering(self.request.query_params.get('ordering'))
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List equipment through the values_list() fast path
+        """
+        serializer = EquipmentRowSerializer()
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*serializer.fields)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(serializer.to_representation(page))
+
+
+class JobViewSet(IdLookupMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for background job status (read-only)
+    """
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        """
+        Return jobs of the current user
+        """
+        return Job.objects.filter(user=self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Download the PDF report produced by a finished report job
+        """
+        job = self.get_object()
+        
+        if job.kind != Job.KIND_PDF_REPORT:
+            return Response({'error': 'Job has no downloadable result'}, status=status.HTTP_400_BAD_REQUEST)
+        if job.state != Job.STATE_SUCCEEDED:
+            return Response(
+                {'error': f'Report is not ready (job is {job.state})', 'job': JobSerializer(job).data},
+                status=status.HTTP_409_CONFLICT
+            )
+        if job.dataset is None:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # The job left the report in the cache; it is rebuilt if evicted since
+        report, etag = get_pdf_report(job.dataset, job.options.get('summary_only', False))
+        return file_download_response(request, report, job.filename, 'application/pdf', etag=etag)
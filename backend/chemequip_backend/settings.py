@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chemequip_backend.api.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -41,6 +42,22 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Cache for summary responses. Entries are validated against per-user data
+# versions stored in the database, so any backend is safe; a shared one such
+# as Redis lets several processes reuse entries (see DEPLOYMENT.md)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chemequip',
+    }
+}
+SUMMARY_CACHE_TIMEOUT = 3600
+
+# Per-request SQL instrumentation: X-Query-Count / X-Query-Time-Ms headers,
+# and a logged warning for requests running more than QUERY_BUDGET queries
+QUERY_INSTRUMENTATION = DEBUG
+QUERY_BUDGET = 20
+
 ROOT_URLCONF = 'chemequip_backend.urls'
 
 TEMPLATES = [
@@ -66,6 +83,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Background job workers write concurrently with web requests
+            'timeout': 20,
+        },
     }
 }
 
@@ -111,6 +132,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'chemequip_backend.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
@@ -128,6 +153,63 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 FILE_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'uploads_temp')
 
+# CSV uploads are streamed to disk by StreamingCSVUploadHandler in
+# CSV_UPLOAD_CHUNK_SIZE pieces, so their size is not bound by the memory
+# limits above
+FILE_UPLOAD_HANDLERS = [
+    'chemequip_backend.api.upload_handlers.StreamingCSVUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+CSV_UPLOAD_CHUNK_SIZE = 65536  # 64KB
+CSV_UPLOAD_MAX_SIZE = 209715200  # 200MB
+
+# CSV ingest: number of rows parsed and inserted per batch
+CSV_INGEST_BATCH_SIZE = 2000
+
+# Streaming NDJSON export: rows fetched from the database per chunk
+EXPORT_CHUNK_SIZE = 2000
+
+# Dataset downloads: hand the transfer to the front proxy instead of
+# streaming it from Python. None, 'x-sendfile' (Apache/lighttpd) or
+# 'x-accel-redirect' (nginx, with an internal location mapping
+# DATASET_SENDFILE_PREFIX to MEDIA_ROOT)
+DATASET_SENDFILE = None
+DATASET_SENDFILE_PREFIX = '/protected-media/'
+
+# Generated PDF reports are cached under MEDIA_ROOT/PDF_CACHE_DIR, keyed
+# by dataset and content hash; least recently used reports are evicted
+# once the directory exceeds PDF_CACHE_MAX_SIZE bytes
+PDF_CACHE_DIR = 'reports'
+PDF_CACHE_MAX_SIZE = 524288000  # 500MB
+
+# PDF equipment details: rows per LongTable chunk (about one page) and the
+# most rows listed in a report (None = all; ?mode=summary lists none)
+PDF_TABLE_CHUNK_ROWS = 25
+PDF_MAX_DETAIL_ROWS = 10000
+
+# Datasets kept per user; older ones are deleted after each upload (None
+# keeps all). Their files are removed later by `manage.py collect_garbage`,
+# which skips files modified in the last GC_MIN_AGE seconds
+DATASET_RETENTION_COUNT = 5
+GC_MIN_AGE = 3600
+
+# ZIP batch uploads: processes used to parse members (None = CPU count)
+CSV_ARCHIVE_WORKERS = None
+
+# Background jobs: when CSV_UPLOAD_ASYNC is True (or ?async=1 is passed)
+# uploads are queued and processed by `manage.py process_jobs`
+CSV_UPLOAD_ASYNC = False
+# Same for PDF reports (generate_pdf/?async=1); download with jobs/{id}/download/
+PDF_REPORT_ASYNC = False
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 2.0  # seconds
+# Jobs still running JOB_TIMEOUT seconds after a worker claimed them are
+# re-queued (the worker is assumed dead), and failed after JOB_MAX_ATTEMPTS
+# claims; keep it above the longest expected job (None = never expire)
+JOB_TIMEOUT = 3600
+JOB_MAX_ATTEMPTS = 2
+
 # Create uploads directory if it doesn't exist
 os.makedirs(FILE_UPLOAD_TEMP_DIR, exist_ok=True)
 os.makedirs(MEDIA_ROOT, exist_ok=True)
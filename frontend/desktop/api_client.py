@@ -51,3 +51,8 @@ class APIClient:
     def get_summary(self, dataset_id):
         url = f"{self.base_url}/api/datasets/{dataset_id}/summary/"
         return self.session.get(url)
+
+    def get_histogram(self, dataset_id, param, bins=20):
+        # Bins are computed on the server, so the dataset is never downloaded
+        url = f"{self.base_url}/api/datasets/{dataset_id}/histogram/"
+        return self.session.get(url, params={'param': param, 'bins': bins})
@@ -16,7 +16,6 @@ from PyQt5.QtWidgets import (
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
-import pandas as pd
 
 from api_client import APIClient
 
@@ -33,9 +32,11 @@ class ChartCanvas(FigureCanvas):
         self.axes.set_title(title)
         self.draw()
 
-    def plot_hist(self, series, title=''):
+    def plot_hist(self, bin_edges, counts, title=''):
+        # Pre-binned counts from the histogram endpoint; bin_edges has one more entry
         self.axes.clear()
-        self.axes.hist(series.dropna(), bins=20)
+        widths = [right - left for left, right in zip(bin_edges, bin_edges[1:])]
+        self.axes.bar(bin_edges[:-1], counts, width=widths, align='edge')
         self.axes.set_title(title)
         self.draw()
 
@@ -155,23 +156,15 @@ class DesktopApp(QWidget):
             values = list(types.values())
             self.chart.plot_bar(labels, values, title='Equipment by Type')
         else:
-            # if numeric fields exist, show histogram of flowrate
-            df = self._fetch_dataset_dataframe(dataset_id)
-            if df is not None and 'Flowrate' in df.columns:
-                self.chart.plot_hist(df['Flowrate'], title='Flowrate distribution')
-
-    def _fetch_dataset_dataframe(self, dataset_id):
-        # fallback: try to fetch raw CSV from API if available
-        url = f"{self.api.base_url}/api/datasets/{dataset_id}/download/"
-        try:
-            r = self.api.session.get(url)
+            # otherwise show the flowrate histogram, binned by the backend
+            try:
+                r = self.api.get_histogram(dataset_id, 'flowrate')
+            except Exception:
+                return
             if r.ok:
-                from io import StringIO
-
-                return pd.read_csv(StringIO(r.text))
-        except Exception:
-            return None
-        return None
+                hist = r.json()
+                if hist.get('count'):
+                    self.chart.plot_hist(hist['bin_edges'], hist['counts'], title='Flowrate distribution')
 
 
 def main():